@@ -7,28 +7,29 @@ import json
 import logging
 import os
 import sys
+from collections import deque
 
+from afterdown.core.budget import RunBudget
+from afterdown.core.candidate import Candidate
+from afterdown.core.completion import CompletionChecker
 from afterdown.core.countersummary import CounterSummary
-from afterdown.core.dropboxsync import dropbox_sync, add_magnet_url
-from afterdown.core.email.log import BufferedSmtpHandler
-from afterdown.core.email.mail_report import AfterMailReport
-from afterdown.core.knownfiles import KnownFiles
-from afterdown.core.rss import rss_zooqle_sync
-from afterdown.core.rules import Rule, ApplyResult
-from afterdown.core.utils import recursive_update, dependency_resolver
+from afterdown.core.decisioncache import DecisionCache
+from afterdown.core.executor import ActionExecutor
+from afterdown.core import guessitcache
+from afterdown.core.guessitcache import GuessitStore
+from afterdown.core.knownfiles import open_known_files
+from afterdown.core.profile import rules_profile, format_profile, export_profile
+from afterdown.core.rules import Rule, ApplyResult, rules_fingerprint
+from afterdown.core.ruleset import RuleSet
+from afterdown.core.scanindex import ScanIndex
+from afterdown.core.walker import walk_source
+from afterdown.core.watch import SourceWatcher, DEFAULT_DEBOUNCE
+from afterdown.core import utils
+from afterdown.core.utils import recursive_update, dependency_resolver, VideoTypeStats
 
 VERSION = "0.9.93"
-FS_ENC = 'UTF-8'
 PROJECT_PATH = os.path.dirname(__file__)
 
-try:
-    import requests
-except ImportError:
-    requests = None
-
-print(("AfterDown %s" % VERSION))
-print(("Copyright (C) 2015-%s  Dario Varotto\n" % datetime.date.today().year))
-
 
 class AfterDown(object):
     def get_logger(self, log_path=None):
@@ -70,159 +71,385 @@ class AfterDown(object):
         self.error_mail_handler = None  # BufferedSmtpHandler, flushed when need to send mail
         self.report_mail = None  # the AfterMailReport that will send the pretty report
         self.knownfiles = None
+        self.scanindex = None  # the ScanIndex, when we keep it
+        self.completion = None  # the CompletionChecker, deferring the files still being written
+        self.budget = None  # the RunBudget, limiting the files processed in a run
+        self.decisions = None  # the DecisionCache, when we keep it
+        self.kodi_update_needed = False
+        self.ruleset = None  # the RuleSet classifying the candidates
+        self.executor = None  # the ActionExecutor applying the rules
+        self.applying = deque()  # the (candidate, rule, future) submitted to the executor
+        self.classifier = None  # the ClassifierPool, when classifying in other processes
+        self.classifying = deque()  # the PendingChunk sent to the ClassifierPool
 
     def run(self):
-        if self.config is None:
-            self.config = self.read_config()
-        self.knownfiles = KnownFiles(self.config["knownfiles"])
-        counters = self.counters
-        kodi_update_needed = False
-        logger = self.logger
-
+        self.start_run()
         if self.COMMIT:
-            root = os.path.abspath(self.config['source'])
-            assert os.path.isdir(root), "Cannot find the defined source %s" % root
-
-            # on walk and on file operations use encoded binary strings
-
-            for foldername, dirnames, filenames in os.walk(root.encode('utf-8'),
-                                                           followlinks=True):
-                foldername = foldername.decode(FS_ENC)
-                logger.debug(foldername[len(root) + 1:] or "/")
-                for filename in filenames:
-                    filename = filename.decode(FS_ENC)
-
-                    counters['_tot'] += 1
-                    fullpath = os.path.join(foldername, filename)
-                    filepath = os.path.join(foldername[len(root) + 1:], filename)
-                    # each file found is a possible candidate...
-                    candidate = dict(
-                        filepath=filepath,  # with a path relative to the source
-                        fullpath=fullpath,
-                        # the fullpath, needed if the rule wants to access the file
-                        # other eventual things will be added from the rules when needed...
-                        # possible candidates are: extension, filesize, xmp tags or things like that
-                    )
-                    matches = []
-                    for rule in self.config["rules"]:
-                        confidence = rule.match(candidate)
-                        if confidence is not False:
-                            matches.append((confidence, rule))
-                    if matches:
-                        # print "It matches %d rules: %s" % (len(matches), matches)
-                        # sort by confidence
-                        rules_by_confidence = {}
-                        max_confidence = 0
-                        for confidence, rule in matches:
-                            # group by confidence
-                            rules = rules_by_confidence.get(confidence, [])
-                            rules.append(rule)
-                            rules_by_confidence[confidence] = rules
-                            if confidence > max_confidence:
-                                max_confidence = confidence
-
-                        # if there is only one rule with top confidence apply it
-                        if len(rules_by_confidence[max_confidence]) == 1:
-                            rule = rules_by_confidence[max_confidence][0]
-                            done = rule.apply(candidate, commit=self.COMMIT)
-                            if done.action in (Rule.ACTION_DELETE, Rule.ACTION_MOVE):
-                                target_file = done.filepath
-                                touched_folder = os.path.dirname(target_file)
-                                self.touched_folders.add(touched_folder)
-                            if done.action == Rule.ACTION_MOVE and rule.updateKodi:
-                                kodi_update_needed = True
-                            logger.info("%s" % done)
-                            if self.report_mail:
-                                self.report_mail.add_row(done)
-                            counters[done.actionName or done.action] += 1
-                        else:
-                            logger.warning("UNSURE: %s matches %s" % (filepath, matches))
-                            if not self.knownfiles.is_known(filepath):
-                                # warn for unsure files only when they are new
-                                counters['_unsure_new'] += 1
-                                if self.report_mail:
-                                    done = ApplyResult(action=Rule.ACTION_UNSURE, filepath=filepath)
-                                    # add some forced token to the row
-                                    # (the rule doesn't know how may rules apply)
-                                    self.report_mail.add_row(
-                                        done,
-                                        tokens=done.tokens + [
-                                            "%d matching rules" % len(
-                                                rules_by_confidence[max_confidence])])
-                            else:
-                                logger.debug("Unsure file %s is not new" % filepath)
-                                counters['_unsure_old'] += 1
-                    else:
-                        logger.info("%s does not match" % filepath)
-                        if not self.knownfiles.is_known(filepath):
-                            counters['_unknown_new'] += 1
-                            # warn for unknow files only when they are new
-                            if self.report_mail:
-                                done = ApplyResult(action=Rule.ACTION_UNKNOWN, filepath=filepath)
-                                self.report_mail.add_row(done)
-                        else:
-                            logger.debug("Unknown file %s is not new" % filepath)
-                            counters['_unknown_old'] += 1
-
-            # LATER: Check the file is not in use
-            if kodi_update_needed \
-                and self.config.get("kodi", {}).get('requestUpdate', False) \
-                and self.COMMIT:
-                if not requests:
-                    logger.error("Requests is needed to syncronize with Kodi.")
-                    logger.error("Install it with 'pip install requests'.")
-                else:
-                    kodi_host = self.config['kodi'].get('host', 'localhost')
-                    logger.info(
-                        "Something changed on target folder, asking Kodi to update video library.")
-                    try:
-                        response = requests.post(
-                            'http://{kodi_host}/jsonrpc'.format(
-                                kodi_host=kodi_host
-                            ),
-                            headers={"Content-Type": "application/json"},
-                            data=json.dumps(dict(
-                                jsonrpc="2.0",
-                                method="VideoLibrary.Scan",
-                                params={},
-                                id=1
-                            )),
-                        )
-                        if response.status_code != 200 or response.json().get('result') != 'OK':
-                            logger.error(
-                                "Update Kody library failed, check jsonrpc is enabled."
-                            )
-                        if self.report_mail:
-                            done = ApplyResult(action=Rule.ACTION_KODI_REFRESH, filepath="")
-                            self.report_mail.add_row(done)
-                    except Exception as e:
-                        logger.error(
-                            "Errors when trying to communicate with Kodi, "
-                            "You'll have to update your video library manually.")
-                        logger.error(kodi_host)
-                        logger.error("%s" % e)
-
-            if self.touched_folders and self.deleteEmptyFolders:
-                logger.debug("Touched folders %s", self.touched_folders)
-                self.do_delete_touched_folders()
+            root = self.get_root()
+            # the chunks sent to other processes should be big enough to pay the trip
+            batch_size = self.config.get("batchSize") or (256 if self.classifier else 1)
+            batch = []
+            for candidate in self.get_candidates(root):
+                if self.budget:
+                    if self.budget.exhausted():
+                        break
+                    self.budget.add(candidate)
+                batch.append(candidate)
+                if len(batch) >= batch_size:
+                    self.process_candidates(batch)
+                    batch = []
+            if batch:
+                self.process_candidates(batch)
+            self.report_classified(wait=True)
+            if self.completion and self.completion.deferred:
+                self.counters['_deferred'] = len(self.completion.deferred)
+            self.complete_changes()
         if "dropbox" in self.config and self.COMMIT:
             self.dropbox_sync()
         if "rssfeed" in self.config:
             self.get_rssfeed()
+        self.end_run()
+        if self.file_logger:
+            self.file_logger.close()
 
-        summary = "%s" % counters
-        logger.info(summary)
+    def watch(self, debounce=DEFAULT_DEBOUNCE):
+        """ Run on the whole source folder, then keep watching it:
+            files created or moved there are processed when nobody wrote them for debounce seconds
+        """
+        assert self.COMMIT, "Watching the source makes sense only when we commit the changes"
+        if self.config is None:
+            self.config = self.read_config()
+        root = self.get_root()
+        # start watching before the first run, so the files arriving meanwhile are not lost
+        watcher = SourceWatcher(root, debounce=debounce)
+        try:
+            self.run()
+            self.scanindex = None  # the index is for the scan, changed folders will be relisted
+            self.budget = None  # the budget is for the scan, changes are always processed
+            self.logger.info("Watching %s for changes" % root)
+            for filepaths in watcher:
+                self.process_changes(root, filepaths)
+        except KeyboardInterrupt:
+            self.logger.info("Stop watching %s" % root)
+        finally:
+            watcher.close()
+            if self.file_logger:
+                self.file_logger.close()
+
+    def process_changes(self, root, filepaths):
+        """ Process the files changed in the source, then report as a run would do
+            the known files not in this batch are not forgotten
+        """
+        self.counters = CounterSummary()
+        self.knownfiles = open_known_files(self.config["knownfiles"])
+        self.executor = self.get_executor()
+        if self.report_mail:
+            self.report_mail.reset()
+        for filepath in filepaths:
+            fullpath = os.path.join(root, filepath)
+            if os.path.isfile(fullpath):  # still there, and not a folder
+                self.process_candidate(Candidate(filepath=filepath, fullpath=fullpath))
+        self.complete_changes()
+        self.end_run(forget=False)
+
+    def start_run(self):
+        if self.config is None:
+            self.config = self.read_config()
+        self.knownfiles = open_known_files(self.config["knownfiles"])
+        self.executor = self.get_executor()
+        if self.config.get("scanindex"):
+            self.scanindex = ScanIndex(
+                self.config["scanindex"],
+                fingerprint=rules_fingerprint(self.config["rules"],
+                                              target=self.config.get("target")),
+            )
+        if self.config.get("decisioncache"):
+            self.decisions = DecisionCache(
+                self.config["decisioncache"],
+                fingerprint=rules_fingerprint(self.config["rules"],
+                                              target=self.config.get("target")),
+            )
+            self.ruleset.cache = self.decisions
+        utils.video_type_stats = VideoTypeStats(check=self.config.get("checkVideoTypes", False))
+        guessitcache.set_store(GuessitStore(self.config["guessitcache"])
+                               if self.config.get("guessitcache") else None)
+        # after the store and the stats, the workers use them
+        if (self.config.get("classifyWorkers") or 1) > 1 and self.COMMIT:
+            from afterdown.core.classifypool import ClassifierPool  # multiprocessing, when needed
+            self.classifier = ClassifierPool(self.ruleset, workers=self.config["classifyWorkers"])
+        if self.config.get("maxSeconds") or self.config.get("maxFiles"):
+            self.budget = RunBudget(
+                self.config["cursorfile"],
+                max_seconds=self.config.get("maxSeconds"),
+                max_files=self.config.get("maxFiles"),
+                order=self.config.get("budgetOrder") or "walk",
+            )
+        if self.config.get("completionWindow") or self.config.get("checkWriters"):
+            self.completion = CompletionChecker(
+                self.config["deferredfiles"],
+                window=self.config.get("completionWindow") or 0,
+                check_writers=self.config.get("checkWriters", False),
+            )
+
+    def get_executor(self):
+        return ActionExecutor(
+            workers=self.config.get("applyWorkers") or 1,
+            device_workers=self.config.get("deviceWorkers") or 1,
+            commit=self.COMMIT,
+        )
+
+    def get_root(self):
+        root = os.path.abspath(self.config['source'])
+        assert os.path.isdir(root), "Cannot find the defined source %s" % root
+        return root
+
+    def complete_changes(self):
+        """ After the files are processed, ask Kodi to update and remove the emptied folders """
+        logger = self.logger
+        self.report_applied(wait=True)
+        if self.kodi_update_needed \
+            and self.config.get("kodi", {}).get('requestUpdate', False) \
+            and self.COMMIT:
+            self.kodi_update_needed = False
+            try:
+                import requests  # imported only when we have to talk with Kodi
+            except ImportError:
+                requests = None
+            if not requests:
+                logger.error("Requests is needed to syncronize with Kodi.")
+                logger.error("Install it with 'pip install requests'.")
+            else:
+                kodi_host = self.config['kodi'].get('host', 'localhost')
+                logger.info(
+                    "Something changed on target folder, asking Kodi to update video library.")
+                try:
+                    response = requests.post(
+                        'http://{kodi_host}/jsonrpc'.format(
+                            kodi_host=kodi_host
+                        ),
+                        headers={"Content-Type": "application/json"},
+                        data=json.dumps(dict(
+                            jsonrpc="2.0",
+                            method="VideoLibrary.Scan",
+                            params={},
+                            id=1
+                        )),
+                    )
+                    if response.status_code != 200 or response.json().get('result') != 'OK':
+                        logger.error(
+                            "Update Kody library failed, check jsonrpc is enabled."
+                        )
+                    if self.report_mail:
+                        done = ApplyResult(action=Rule.ACTION_KODI_REFRESH, filepath="")
+                        self.report_mail.add_row(done)
+                except Exception as e:
+                    logger.error(
+                        "Errors when trying to communicate with Kodi, "
+                        "You'll have to update your video library manually.")
+                    logger.error(kodi_host)
+                    logger.error("%s" % e)
+
+        if self.touched_folders and self.deleteEmptyFolders:
+            logger.debug("Touched folders %s", self.touched_folders)
+            self.do_delete_touched_folders()
+
+    def end_run(self, forget=True):
+        """ Log the summary, send the mails and save what we know for the next run """
+        summary = "%s" % self.counters
+        self.logger.info(summary)
         if self.report_mail:
             self.report_mail.set_summary(summary)
 
+        if self.executor:
+            self.executor.shutdown()
+        if self.classifier:
+            self.classifier.shutdown()
+            self.classifier = None
+        self.report_video_types()
+        if self.config.get("profileRules") or self.config.get("profileOut"):
+            self.report_profile(self.config.get("profileOut"))
         if self.error_mail_handler:
             self.error_mail_handler.flush()
         if self.report_mail:
             self.report_mail.send()
+        if self.budget and self.budget.partial:
+            forget = False  # we didn't see all the source, keep what we know of the rest
         if not self.DEBUG:
-            self.knownfiles.save()
-        if self.file_logger:
-            self.file_logger.close()
+            self.knownfiles.save(forget=forget)
+            if self.scanindex and self.COMMIT:
+                self.scanindex.save(forget=forget)
+            if self.decisions and self.COMMIT:
+                self.decisions.save(forget=forget)
+            if guessitcache.store and self.COMMIT:
+                guessitcache.store.save(forget=forget)
+            if self.budget and self.COMMIT:
+                self.budget.save()
+            if self.completion and self.COMMIT:
+                self.completion.save(forget=forget)
+
+    def report_video_types(self):
+        """ Log how the video types were found, and the filenames where guessit disagrees """
+        stats = utils.video_type_stats
+        if not stats.quick and not stats.guessit:
+            return
+        if stats.check:
+            self.logger.info("%s" % stats)
+            for filename, quick_type, guessed_type in stats.disagreed:
+                self.logger.info("%s looks a %s, guessit says %s" % (filename, quick_type,
+                                                                     guessed_type))
+        else:
+            self.logger.debug("%s" % stats)
+
+    def report_profile(self, export_path=None):
+        """ Log the rules statistics, the most expensive first, and eventually export them """
+        profile = rules_profile(self.ruleset)
+        self.logger.info("Rules profile:\n%s" % format_profile(profile))
+        if export_path:
+            export_profile(profile, export_path)
+
+    def get_candidates(self, root):
+        """ Return an iterator over the candidates, one for each file found in the source folder
+            each candidate is a Candidate with the file properties
+        """
+        workers = self.config.get("walkWorkers") or 1
+        if self.scanindex:
+            candidates = self.scanindex.walk(root, workers=workers)
+        else:
+            candidates = walk_source(root, workers=workers)
+        if self.budget:
+            candidates = self.budget.arrange(candidates)
+        if self.completion:
+            # the files still being written are left for the next run
+            candidates = self.completion.complete(root, candidates)
+        return candidates
+
+    def process_candidate(self, candidate):
+        """ Classify the candidate, then apply the matching rule (maybe in a worker) """
+        self.counters['_tot'] += 1
+        if candidate.outcome and self.replay_outcome(candidate):
+            return
+        self.process_decision(self.ruleset.classify(candidate))
+
+    def process_candidates(self, candidates):
+        """ As process_candidate, classifying a chunk of candidates at once """
+        if len(candidates) == 1 and not self.classifier:
+            return self.process_candidate(candidates[0])
+        to_classify = []
+        for candidate in candidates:
+            self.counters['_tot'] += 1
+            if not (candidate.outcome and self.replay_outcome(candidate)):
+                to_classify.append(candidate)
+        if self.classifier:
+            self.classifying.append(self.classifier.submit(to_classify))
+            # keep a few chunks for each worker, not the whole source in memory
+            too_many = len(self.classifying) > 2 * self.config["classifyWorkers"]
+            self.report_classified(wait_first=too_many)
+            return
+        for decision in self.ruleset.classify_batch(to_classify):
+            self.process_decision(decision)
+
+    def report_classified(self, wait=False, wait_first=False):
+        """ Process the decisions of the chunks classified by the ClassifierPool, in order
+            when wait, wait for all of them, when wait_first wait at least for the first one
+        """
+        while self.classifying and (wait or wait_first or self.classifying[0].done()):
+            wait_first = False
+            for decision in self.classifying.popleft().result():
+                self.process_decision(decision)
+
+    def process_decision(self, decision):
+        """ Apply the rule chosen for the candidate, or report it as unsure or unknown """
+        counters = self.counters
+        logger = self.logger
+        candidate = decision.candidate
+        filepath = candidate.filepath
+        if decision.rule:
+            future = self.executor.submit(decision.rule, candidate)
+            self.applying.append((candidate, decision.rule, future))
+            self.report_applied()
+        elif decision.unsure:
+            logger.warning("UNSURE: %s matches %s" % (filepath, decision.matches))
+            self.record_outcome(candidate, Rule.ACTION_UNSURE)
+            if not self.knownfiles.is_known(filepath):
+                # warn for unsure files only when they are new
+                counters['_unsure_new'] += 1
+                if self.report_mail:
+                    done = ApplyResult(action=Rule.ACTION_UNSURE, filepath=filepath)
+                    # add some forced token to the row
+                    # (the rule doesn't know how may rules apply)
+                    self.report_mail.add_row(
+                        done,
+                        tokens=done.tokens + ["%d matching rules" % len(decision.top)])
+            else:
+                logger.debug("Unsure file %s is not new" % filepath)
+                counters['_unsure_old'] += 1
+        else:
+            logger.info("%s does not match" % filepath)
+            self.record_outcome(candidate, Rule.ACTION_UNKNOWN)
+            if not self.knownfiles.is_known(filepath):
+                counters['_unknown_new'] += 1
+                # warn for unknow files only when they are new
+                if self.report_mail:
+                    done = ApplyResult(action=Rule.ACTION_UNKNOWN, filepath=filepath)
+                    self.report_mail.add_row(done)
+            else:
+                logger.debug("Unknown file %s is not new" % filepath)
+                counters['_unknown_old'] += 1
+
+    def report_applied(self, wait=False):
+        """ Report the rules applied, in the order they were submitted, as soon as they are done
+            when wait, wait for all of them
+        """
+        counters = self.counters
+        while self.applying and (wait or self.applying[0][2].done()):
+            candidate, rule, future = self.applying.popleft()
+            try:
+                done = future.result()
+            except (IOError, OSError) as e:
+                self.logger.error("Error applying %s to %s. %s" % (rule.actionName or rule.action,
+                                                                   candidate.filepath, e))
+                counters['_failed'] += 1
+                continue
+            if done.action in (Rule.ACTION_DELETE, Rule.ACTION_MOVE):
+                target_file = done.filepath
+                touched_folder = os.path.dirname(target_file)
+                self.touched_folders.add(touched_folder)
+            if done.action in Rule.TARGET_ACTIONS and rule.updateKodi:
+                self.kodi_update_needed = True
+            if done.action == Rule.ACTION_SKIP and rule.action == Rule.ACTION_SKIP:
+                # skipped by the rule (not because the target exists), it will be skipped again
+                # the files linked before are checked again, their link may be gone
+                self.record_outcome(candidate, done.actionName or done.action)
+            self.logger.info("%s" % done)
+            if self.report_mail:
+                self.report_mail.add_row(done)
+            counters[done.actionName or done.action] += 1
+
+    def record_outcome(self, candidate, outcome):
+        """ Keep the outcome of a file that stays in the source in the scan index """
+        if self.scanindex:
+            self.scanindex.record(candidate, outcome)
+
+    def replay_outcome(self, candidate):
+        """ The candidate didn't change since the previous run, and the rules are the same:
+            count its previous outcome without classifying it again.
+            Return False when the candidate has to be classified anyway
+        """
+        outcome = candidate.outcome
+        filepath = candidate.filepath
+        if outcome in (Rule.ACTION_UNKNOWN, Rule.ACTION_UNSURE):
+            if not self.knownfiles.is_known(filepath):
+                return False  # we forgot it, so it's new: let's classify and report it again
+            self.logger.debug("%s file %s is unchanged" % (outcome.capitalize(), filepath))
+            self.counters['_%s_old' % outcome.lower()] += 1
+        else:
+            done = ApplyResult(action=Rule.ACTION_SKIP, actionName=outcome, filepath=filepath)
+            self.logger.info("%s" % done)
+            if self.report_mail:
+                self.report_mail.add_row(done)
+            self.counters[outcome] += 1
+        self.record_outcome(candidate, outcome)
+        return True
 
     def read_config(self):
         with open(self.config_file) as f:
@@ -267,6 +494,7 @@ class AfterDown(object):
             dependency_resolver(types_definition, get_dependencies, add_type_to_config)
 
         config["rules"] = [Rule(rule_def, config=config) for rule_def in config["rules"]]
+        self.ruleset = RuleSet(config["rules"])
         # defaults for kodi configuration
         if "kodi" not in config:
             config["kodi"] = dict(host="localhost",
@@ -274,6 +502,9 @@ class AfterDown(object):
 
         if "mail" in config:
             if config['mail']:
+                # smtplib and email only when we send mails
+                from afterdown.core.email.log import BufferedSmtpHandler
+                from afterdown.core.email.mail_report import AfterMailReport
                 default_mail_settings = dict(
                     subject="Afterdown report",
                     smtp="localhost:25",
@@ -321,6 +552,10 @@ class AfterDown(object):
 
         if "knownfiles" not in config or not config["knownfiles"]:
             config["knownfiles"] = ".afterknown"
+        if "cursorfile" not in config or not config["cursorfile"]:
+            config["cursorfile"] = ".aftercursor"
+        if "deferredfiles" not in config or not config["deferredfiles"]:
+            config["deferredfiles"] = ".afterdeferred"
         if "rssknown" not in config or not config["rssknown"]:
             config["rssknown"] = ".afterknown_rss.json"
         return config
@@ -350,6 +585,7 @@ class AfterDown(object):
             Try to sync with a dropbox folder for various reason, actually to get a list of torrents
             to pass to Transmission
         """
+        from afterdown.core.dropboxsync import dropbox_sync  # the Dropbox SDK only when configured
         source_files = dropbox_sync(
             keyfile=".afterdown_dropbox_keys.json",
             torrents_folder=self.config['dropbox'].get("start_torrents_on"),
@@ -366,6 +602,8 @@ class AfterDown(object):
                     self.report_mail.add_row(download_result)
 
     def get_rssfeed(self):
+        from afterdown.core.dropboxsync import add_magnet_url
+        from afterdown.core.rss import rss_zooqle_sync  # requests only when configured
         rss_config = self.config['rssfeed']
 
         def add_url(title, url):
@@ -390,6 +628,8 @@ class AfterDown(object):
 # DONE: Send mail of the activities
 # DONE: Keep the movie in a separate folder based on the filename without extension
 def main():
+    print(("AfterDown %s" % VERSION))
+    print(("Copyright (C) 2015-%s  Dario Varotto\n" % datetime.date.today().year))
     parser = argparse.ArgumentParser(
         "Afterdown",
         description="Sort everything in a folder based on some rules you define")
@@ -426,8 +666,81 @@ def main():
                         default=None
                         )
     parser.add_argument("--knownfiles",
-                        help="Filepath used to save a list of know missed files",
+                        help="Filepath used to save a list of know missed files"
+                             " (a SQLite database with a .db or .sqlite extension)",
+                        default="")
+    parser.add_argument("--scanindex",
+                        help="Filepath used to index the source folder, so unchanged folders"
+                             " and files are not scanned again (disabled by default)",
+                        default="")
+    parser.add_argument("--decisioncache",
+                        help="Filepath used to cache the classification of the files"
+                             " staying in the source (disabled by default)",
+                        default="")
+    parser.add_argument("--batchsize",
+                        help="Classify the files in chunks of this size (default 1)",
+                        type=int,
+                        default=None)
+    parser.add_argument("--guessitcache",
+                        help="Filepath used to keep the guessit parses of the files"
+                             " staying in the source (disabled by default)",
                         default="")
+    parser.add_argument("--classifyworkers",
+                        help="Classify the files with this many processes, on many cores",
+                        type=int,
+                        default=None)
+    parser.add_argument("--walkworkers",
+                        help="List the source folders with this many threads"
+                             " (useful on network storage)",
+                        type=int,
+                        default=None)
+    parser.add_argument("--applyworkers",
+                        help="Move and delete the files with this many threads,"
+                             " doing at most one operation at a time on each target disk",
+                        type=int,
+                        default=None)
+    parser.add_argument("--completionwindow",
+                        help="Defer to the next run the files changed in the last seconds",
+                        type=float,
+                        default=None)
+    parser.add_argument("--maxseconds",
+                        help="Stop processing files after these seconds,"
+                             " the next run will continue from there",
+                        type=float,
+                        default=None)
+    parser.add_argument("--maxfiles",
+                        help="Process at most these files in a run,"
+                             " the next run will continue from there",
+                        type=int,
+                        default=None)
+    parser.add_argument("--budgetorder",
+                        help="With a budget, process the files in the walk order (the default),"
+                             " by size (biggest first) or by age (oldest first)",
+                        choices=["walk", "size", "age"],
+                        default=None)
+    parser.add_argument("--profilerules",
+                        help="At the end of the run, report the time spent and the matches of each"
+                             " rule",
+                        default=False,
+                        action="store_true")
+    parser.add_argument("--profileout",
+                        help="Export the rules profile as JSON to this file"
+                             " (implies --profilerules)",
+                        default=None)
+    parser.add_argument("--checkvideotypes",
+                        help="Compare the video types found by the filename with guessit,"
+                             " reporting how many agree",
+                        default=False,
+                        action="store_true")
+    parser.add_argument("--watch",
+                        help="Keep running, watching the source folder for new files (Linux only)",
+                        default=False,
+                        action="store_true")
+    parser.add_argument("--debounce",
+                        help="In watch mode, process a file when it is not changed for these"
+                             " seconds (default %d)" % DEFAULT_DEBOUNCE,
+                        type=float,
+                        default=DEFAULT_DEBOUNCE)
     parser.add_argument("source", help="override the folder to be monitored", default=None,
                         nargs="?")
     parser.add_argument("target", help="override the destination folder", default=None, nargs="?")
@@ -451,6 +764,34 @@ def main():
         override_config['mail'] = {"to": args.mailto}
     if args.knownfiles:
         override_config['knownfiles'] = args.knownfiles
+    if args.scanindex:
+        override_config['scanindex'] = args.scanindex
+    if args.decisioncache:
+        override_config['decisioncache'] = args.decisioncache
+    if args.batchsize is not None:
+        override_config['batchSize'] = args.batchsize
+    if args.guessitcache:
+        override_config['guessitcache'] = args.guessitcache
+    if args.classifyworkers is not None:
+        override_config['classifyWorkers'] = args.classifyworkers
+    if args.walkworkers is not None:
+        override_config['walkWorkers'] = args.walkworkers
+    if args.applyworkers is not None:
+        override_config['applyWorkers'] = args.applyworkers
+    if args.maxseconds is not None:
+        override_config['maxSeconds'] = args.maxseconds
+    if args.maxfiles is not None:
+        override_config['maxFiles'] = args.maxfiles
+    if args.budgetorder:
+        override_config['budgetOrder'] = args.budgetorder
+    if args.profilerules:
+        override_config['profileRules'] = True
+    if args.profileout:
+        override_config['profileOut'] = args.profileout
+    if args.checkvideotypes:
+        override_config['checkVideoTypes'] = True
+    if args.completionwindow is not None:
+        override_config['completionWindow'] = args.completionwindow
     sorter = AfterDown(
         config_file=args.config,
         DEBUG=args.debug,  # When debugging no mail are sent
@@ -460,7 +801,10 @@ def main():
         log_path=args.log,
         override_config=override_config,
     )
-    sorter.run()
+    if args.watch:
+        sorter.watch(debounce=args.debounce)
+    else:
+        sorter.run()
 
 
 if __name__ == "__main__":
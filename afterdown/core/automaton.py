@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+
+from collections import deque
+
+
+class Automaton(object):
+    """ An Aho-Corasick automaton: it finds all the patterns contained in a text
+        scanning the text once, whatever the number of patterns
+    """
+
+    def __init__(self, patterns):
+        self.goto = [{}]  # for each state, the next state for a char
+        self.fail = [0]  # for each state, where to continue when the next char doesn't match
+        self.output = [frozenset()]  # for each state, the patterns ending there
+        self.always = set()  # empty patterns, contained in any text
+        outputs = [set()]
+        for pattern in patterns:
+            if not pattern:
+                self.always.add(pattern)
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    outputs.append(set())
+                state = next_state
+            outputs[state].add(pattern)
+        # the failure links, breadth first so the shorter suffixes are ready
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                outputs[next_state] |= outputs[self.fail[next_state]]
+        self.output = [frozenset(output) for output in outputs]
+
+    def search(self, text):
+        """ Return the set of patterns contained in text """
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set(self.always)
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
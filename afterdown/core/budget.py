@@ -0,0 +1,100 @@
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import time
+
+from afterdown.core.walker import walk_key
+
+logger = logging.getLogger("afterdown.budget")
+
+ORDERS = ("walk", "size", "age")
+
+
+class RunBudget(object):
+    """ Limit the time and the files processed in a run, so a big download
+        doesn't make the run overlap the next one.
+
+        When the budget is over, the position of the last processed file is saved as cursor
+        and the next run continues after it (then it starts again from the beginning).
+        In the walk order the cursor is the path of the file.
+        With the size (biggest first) or age (oldest first) orders, the candidates are
+        collected and sorted before processing them, and the cursor is the sort key
+        (as JSON): the files staying in the source (unknown, skipped or deferred) don't come
+        first on every run. The time collecting the candidates is part of the budget.
+    """
+
+    def __init__(self, filepath, max_seconds=None, max_files=None, order="walk"):
+        assert order in ORDERS, "Unknown budget order %s, use one of %s" % (order, ORDERS)
+        self.filepath = filepath
+        self.max_seconds = max_seconds
+        self.max_files = max_files
+        self.order = order
+        self.started = time.time()
+        self.processed = 0
+        self.last = None  # the key of the last candidate processed
+        self.stopped = False
+        self.cursor = None  # the key where the previous run stopped
+        if os.path.isfile(filepath):
+            with open(filepath, 'r') as f:
+                cursor = f.read().strip()
+            if cursor:
+                logger.info("Resuming after %s" % cursor)
+                if order == "walk":
+                    self.cursor = walk_key(cursor)
+                else:
+                    try:
+                        self.cursor = json.loads(cursor)
+                    except ValueError:
+                        logger.warning("The cursor %s doesn't fit the %s order" % (cursor, order))
+
+    @property
+    def partial(self):
+        """ True when this run didn't see all the source """
+        return self.stopped or self.cursor is not None
+
+    def key(self, candidate):
+        """ The position of the candidate in the order """
+        if self.order == "size":
+            return [-candidate.size, candidate.filepath]
+        if self.order == "age":
+            return [candidate.stat.st_mtime, candidate.filepath]
+        return walk_key(candidate.filepath)
+
+    def arrange(self, candidates):
+        """ Return the candidates in the order they should be processed """
+        if self.order != "walk":
+            collected = []
+            for candidate in candidates:
+                if self.exhausted():
+                    break
+                collected.append(candidate)
+            candidates = sorted(collected, key=self.key)
+        if self.cursor:
+            cursor = self.cursor
+            return (candidate for candidate in candidates if self.key(candidate) > cursor)
+        return candidates
+
+    def exhausted(self):
+        """ Check the budget before processing another file, stopping when it's over """
+        if (self.max_files and self.processed >= self.max_files) \
+            or (self.max_seconds and time.time() - self.started >= self.max_seconds):
+            logger.info("Run budget exhausted after %d files, the next run will continue" %
+                        self.processed)
+            self.stopped = True
+        return self.stopped
+
+    def add(self, candidate):
+        self.processed += 1
+        self.last = candidate.filepath if self.order == "walk" else json.dumps(self.key(candidate))
+
+    def save(self):
+        if not self.stopped:
+            if os.path.isfile(self.filepath):
+                os.remove(self.filepath)  # we got to the end, start again from the beginning
+        elif self.last:
+            logger.debug("Saving to %s" % self.filepath)
+            with open(self.filepath, 'w') as f:
+                f.write(self.last)
+        # stopped before processing a file, the cursor of the previous run stays
@@ -0,0 +1,97 @@
+from __future__ import unicode_literals
+
+import os
+
+from afterdown.core.matching import remove_special_chars
+from afterdown.core.season_info import get_episode_infos
+
+
+class Candidate(object):
+    """ A file found in the source folder, a candidate to be sorted by the rules
+        filepath is relative to the source, fullpath is absolute (to access the file)
+
+        The features used by the rules (extension, lowercased path, size...) are computed
+        only once, the first time they are asked.
+        When the candidate comes from a scan, its stat comes from the DirEntry.
+    """
+    __slots__ = ('filepath', 'fullpath', 'entry', 'outcome',
+                 '_stat', '_basename', '_extension', '_lower_path', '_words_path',
+                 '_episode_infos', 'shared')
+
+    def __init__(self, filepath, fullpath=None, entry=None, stat=None, outcome=None):
+        self.filepath = filepath
+        self.fullpath = fullpath
+        self.entry = entry  # the os.DirEntry, when the candidate comes from a scan
+        self.outcome = outcome  # the outcome of the previous run, from the ScanIndex
+        self._stat = stat
+        self._basename = None
+        self._extension = None
+        self._lower_path = None
+        self._words_path = None
+        self._episode_infos = None
+        self.shared = {}  # the results of the predicates shared by many rules, by predicate key
+
+    def __getitem__(self, key):
+        # candidates used to be dictionaries, keep them readable as such
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __repr__(self):
+        return "Candidate: %s" % self.filepath
+
+    @property
+    def stat(self):
+        if self._stat is None:
+            if self.entry is not None:
+                self._stat = self.entry.stat()  # follow the symlinks, DirEntry caches the result
+            else:
+                self._stat = os.stat(self.fullpath)
+        return self._stat
+
+    @property
+    def cached_stat(self):
+        """ The stat when already taken, else None: it doesn't make a system call """
+        return self._stat
+
+    @property
+    def size(self):
+        return self.stat.st_size
+
+    @property
+    def basename(self):
+        if self._basename is None:
+            self._basename = os.path.basename(self.filepath)
+        return self._basename
+
+    @property
+    def extension(self):
+        """ The extension lowercased without the initial dot """
+        if self._extension is None:
+            extension = os.path.splitext(self.filepath)[1]
+            self._extension = extension[1:].lower() if extension else extension
+        return self._extension
+
+    @property
+    def lower_path(self):
+        if self._lower_path is None:
+            self._lower_path = self.filepath.lower()
+        return self._lower_path
+
+    @property
+    def words_path(self):
+        """ The lowercased path with just letters and numbers """
+        if self._words_path is None:
+            self._words_path = remove_special_chars(self.filepath).lower()
+        return self._words_path
+
+    @property
+    def episode_infos(self):
+        """ The (season, episode) tuple found in the filename """
+        if self._episode_infos is None:
+            self._episode_infos = get_episode_infos(self.filepath)
+        return self._episode_infos
@@ -0,0 +1,108 @@
+from __future__ import unicode_literals
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from afterdown.core import guessitcache, utils
+from afterdown.core.candidate import Candidate
+from afterdown.core.guessitcache import GuessitStore
+from afterdown.core.ruleset import RuleSet
+from afterdown.core.utils import VideoTypeStats
+
+logger = logging.getLogger("afterdown.classifypool")
+
+worker_ruleset = None  # the RuleSet of a worker process
+
+
+def init_worker(rules, guessit_store_path, check_video_types):
+    """ Prepare a worker as the main process: the rules, the guessit store and the video types stats
+        the worker doesn't save the store, it returns what it used with each chunk
+    """
+    global worker_ruleset
+    worker_ruleset = RuleSet(rules)
+    if guessit_store_path:
+        guessitcache.set_store(GuessitStore(guessit_store_path))
+    utils.video_type_stats = VideoTypeStats(check=check_video_types)
+
+
+def classify_chunk(items):
+    """ Classify the (filepath, fullpath, stat) items in a worker,
+        returning for each one the (confidence, rule position) matches and the top positions,
+        with the guessit parses used and the video types stats of the chunk
+    """
+    candidates = [Candidate(filepath=filepath, fullpath=fullpath, stat=stat)
+                  for filepath, fullpath, stat in items]
+    positions = worker_ruleset.positions
+    decisions = [([(confidence, positions[id(rule)]) for confidence, rule in decision.matches],
+                  [positions[id(rule)] for rule in decision.top])
+                 for decision in worker_ruleset.classify_batch(candidates)]
+    parses = {}
+    if guessitcache.store is not None:
+        parses, guessitcache.store.newdata = guessitcache.store.newdata, {}
+    stats = utils.video_type_stats
+    utils.video_type_stats = VideoTypeStats(check=stats.check)
+    return decisions, parses, stats
+
+
+class PendingChunk(object):
+    """ A chunk of candidates being classified, its decisions are ready when done """
+
+    def __init__(self, ruleset, candidates, decisions, future):
+        self.ruleset = ruleset
+        self.candidates = candidates
+        self.decisions = decisions  # the cached ones, None for the ones in the future
+        self.future = future
+
+    def done(self):
+        return self.future is None or self.future.done()
+
+    def result(self):
+        """ The decisions of the candidates, in order """
+        ruleset = self.ruleset
+        if self.future is not None:
+            pending = [index for index, decision in enumerate(self.decisions) if decision is None]
+            decisions, parses, stats = self.future.result()
+            if guessitcache.store is not None:
+                for filename, parse in parses.items():
+                    guessitcache.store.put(filename, parse)
+            utils.video_type_stats.merge(stats)
+            for index, (matches, top) in zip(pending, decisions):
+                decision = ruleset.decision_from_positions(self.candidates[index], matches, top)
+                ruleset.cache_decision(decision)
+                self.decisions[index] = decision
+            self.future = None
+        for decision in self.decisions:
+            ruleset.count_win(decision)
+        return self.decisions
+
+
+class ClassifierPool(object):
+    """ Classify the candidates on many cores: chunks of candidates are sent to worker processes,
+        each with its copy of the rules, the decisions come back as rule positions.
+        The decision cache is used in this process, so cached candidates aren't sent.
+        The workers use the guessit store and the video types stats of this process,
+        when they are set before creating the pool
+    """
+
+    def __init__(self, ruleset, workers):
+        self.ruleset = ruleset
+        guessit_store_path = guessitcache.store.filepath if guessitcache.store is not None else None
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+                                            initializer=init_worker,
+                                            initargs=(ruleset.rules, guessit_store_path,
+                                                      utils.video_type_stats.check))
+
+    def submit(self, candidates):
+        """ Start classifying the candidates, returning a PendingChunk """
+        decisions = [self.ruleset.cached_decision(candidate) for candidate in candidates]
+        items = []
+        for candidate, decision in zip(candidates, decisions):
+            if decision is None:
+                # the DirEntry can't go to another process, its stat can when already taken:
+                # else the worker stats the file only if its rules need it
+                items.append((candidate.filepath, candidate.fullpath, candidate.cached_stat))
+        future = self.executor.submit(classify_chunk, items) if items else None
+        return PendingChunk(self.ruleset, candidates, decisions, future)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,47 @@
+from __future__ import unicode_literals
+
+from afterdown.core.constants import OPERATORS_MAP
+
+numpy = None  # imported with get_numpy, the first time a batch is big enough
+
+COLUMNAR_MIN_BATCH = 64  # smaller batches are faster without arrays
+COLUMNAR_PREDICATES = ("size",)  # the predicates answered by a vectorized check
+
+
+def get_numpy():
+    """ Return numpy, None when it's not installed """
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+    return numpy or None
+
+
+class CandidateColumns(object):
+    """ The sizes of a batch of candidates as a column, so the size predicates of the rules
+        are a vectorized comparison on the rows they still have to check.
+        The files are stat only when a row meets a size predicate: the rows rejected
+        by the cheaper predicates are never stat
+    """
+
+    def __init__(self, candidates):
+        self.candidates = candidates
+        self.sizes = numpy.zeros(len(candidates), dtype=numpy.int64)
+        self.sized = numpy.zeros(len(candidates), dtype=bool)  # the rows with a known size
+
+    def rows_sizes(self, rows):
+        rows = numpy.asarray(rows, dtype=numpy.intp)
+        for row in rows[~self.sized[rows]]:
+            self.sizes[row] = self.candidates[row].size
+        self.sized[rows] = True
+        return self.sizes[rows]
+
+    def supports(self, predicate):
+        return predicate.name in COLUMNAR_PREDICATES
+
+    def predicate_mask(self, predicate, rows):
+        """ The boolean mask of the rows accepted by the predicate """
+        operator, threshold = predicate.key[1:]  # the size predicate key is ("size", op, threshold)
+        return OPERATORS_MAP[operator](self.rows_sizes(rows), threshold)
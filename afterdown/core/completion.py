@@ -0,0 +1,101 @@
+from __future__ import unicode_literals
+
+import logging
+import os
+import time
+
+from afterdown.core.jsonstore import JsonStore
+
+logger = logging.getLogger("afterdown.completion")
+
+O_ACCMODE = 3  # the access mode bits of the open flags
+DEFERRED_VERSION = 1  # the format of the deferred files list
+
+
+def open_for_writing(root):
+    """ Return the paths under root that some process keeps open for writing,
+        looking at the file descriptors in /proc (only the processes we can see)
+    """
+    writing = set()
+    prefix = os.path.join(root, "")
+    try:
+        pids = [pid for pid in os.listdir("/proc") if pid.isdigit()]
+    except OSError:
+        return writing  # no /proc on this system
+    for pid in pids:
+        fd_folder = os.path.join("/proc", pid, "fd")
+        try:
+            fds = os.listdir(fd_folder)
+        except OSError:  # not our process, or it is gone
+            continue
+        for fd in fds:
+            try:
+                path = os.readlink(os.path.join(fd_folder, fd))
+                if not path.startswith(prefix):
+                    continue
+                with open(os.path.join("/proc", pid, "fdinfo", fd)) as f:
+                    for line in f:
+                        if line.startswith("flags:"):
+                            flags = int(line.split()[1], 8)
+                            if flags & O_ACCMODE in (os.O_WRONLY, os.O_RDWR):
+                                writing.add(path)
+                            break
+            except (OSError, IOError, ValueError):
+                continue
+    return writing
+
+
+def stat_signature(st):
+    return [st.st_size, st.st_mtime]
+
+
+class CompletionChecker(JsonStore):
+    """ Tell the files that are complete from the ones still being written.
+
+        A file is complete when it wasn't modified in the last window seconds
+        (and, when check_writers, no process has it open for writing).
+        The others are deferred to a next run, with their size and mtime: a deferred file that
+        changed since is deferred again, even with an old mtime (ex. a download keeping the
+        original mtime). Nothing waits, a run doesn't last more because a file is downloading.
+        The files are checked in the order they come, the deferred ones as the others.
+    """
+    description = "deferred files list"
+    stamp_key = "version"
+    entries_key = "files"
+
+    def __init__(self, filepath, window=0, check_writers=False):
+        super(CompletionChecker, self).__init__(filepath, stamp=DEFERRED_VERSION)
+        self.window = window
+        self.check_writers = check_writers
+
+    @property
+    def deferred(self):
+        """ The files deferred in this run: {filepath: [size, mtime]} """
+        return self.newdata
+
+    def is_complete(self, candidate, writing):
+        """ Return True when the candidate is complete, otherwise defer it """
+        try:
+            st = candidate.stat
+        except OSError:
+            return False  # gone meanwhile
+        signature = stat_signature(st)
+        previous = self.data.get(candidate.filepath)
+        if candidate.fullpath in writing:
+            reason = "open for writing"
+        elif time.time() - st.st_mtime < self.window:
+            reason = "modified recently"
+        elif previous is not None and previous != signature:
+            reason = "changed since the previous run"
+        else:
+            return True
+        logger.info("%s is %s, deferring it to the next run" % (candidate.filepath, reason))
+        self.newdata[candidate.filepath] = signature
+        return False
+
+    def complete(self, root, candidates):
+        """ Yield the complete candidates, in the order they come """
+        writing = open_for_writing(root) if self.check_writers else set()
+        for candidate in candidates:
+            if self.is_complete(candidate, writing):
+                yield candidate
@@ -6,6 +6,8 @@ PRETTY_NAMES = {
     "_unsure_old": "{value} unsure already met",
     "_unknown_new": "{value} new unknown",
     "_unsure_new": "{value} new unsure",
+    "_deferred": "{value} still being written",
+    "_failed": "{value} failed",
 }
 
 
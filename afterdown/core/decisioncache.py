@@ -0,0 +1,37 @@
+from __future__ import unicode_literals
+
+from afterdown.core.jsonstore import JsonStore
+
+
+class DecisionCache(JsonStore):
+    """ A persistent cache of the classification of the files staying in the source
+        (unknown, unsure, or not moved), so they are not matched again on each run.
+
+        For each file (relative path) we keep its size and mtime and the decision:
+        the (confidence, rule position) of the matches and the positions of the top rules.
+        The whole cache is discarded when the rules fingerprint changes.
+    """
+    description = "decision cache"
+    stamp_key = "fingerprint"
+    entries_key = "decisions"
+
+    def __init__(self, filepath, fingerprint):
+        super(DecisionCache, self).__init__(filepath, stamp=fingerprint)
+        self.hits = 0
+
+    @staticmethod
+    def signature(candidate):
+        st = candidate.stat
+        return [st.st_size, st.st_mtime]
+
+    def get(self, candidate):
+        """ Return the (matches, top) positions of the cached decision, None when not cached """
+        cached = self.data.get(candidate.filepath)
+        if cached is None or cached[:2] != self.signature(candidate):
+            return None
+        self.newdata[candidate.filepath] = cached
+        self.hits += 1
+        return cached[2], cached[3]
+
+    def put(self, candidate, matches, top):
+        self.newdata[candidate.filepath] = self.signature(candidate) + [matches, top]
@@ -65,6 +65,13 @@ class AfterMailReport(object):
         self.summary = ""
         self.max_tokens = 0
 
+    def reset(self):
+        """ Forget the rows and the summary, to start a new report """
+        self.send_mail = False
+        self.rows = []
+        self.summary = ""
+        self.max_tokens = 0
+
     def add_row(self, apply_result, tokens=None, className=None, important=None):
         """ Add the nice row to the HTML, taking tokens and formatting from an ApplyResult instance
             eventually you can force some of the parameters
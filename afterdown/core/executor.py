@@ -0,0 +1,102 @@
+from __future__ import unicode_literals
+
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+
+logger = logging.getLogger("afterdown.executor")
+
+
+class TargetLocks(object):
+    """ A lock for each target path, so parallel moves don't race on the same destination """
+
+    def __init__(self):
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, path):
+        with self.lock:
+            if path not in self.locks:
+                self.locks[path] = threading.Lock()
+            return self.locks[path]
+
+
+class ActionExecutor(object):
+    """ Apply the rules to the candidates, in a bounded pool of threads
+        limiting the concurrent operations on each target device:
+        the operations on a busy device wait in its queue without taking a thread,
+        so a slow move to a disk doesn't stop the moves to another one, nor the scan.
+        With a single worker the rules are applied immediately, in the calling thread
+    """
+
+    def __init__(self, workers=1, device_workers=1, commit=True):
+        self.commit = commit
+        self.device_workers = device_workers
+        self.pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        self.device_running = {}  # device: how many operations are running on it
+        self.device_pending = {}  # device: the (rule, candidate, future) waiting for it
+        self.outstanding = 0  # the operations submitted and not done
+        self.rule_devices = {}  # rule: target device, the device of the rule target folder
+        self.target_locks = TargetLocks()
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+
+    def get_device(self, rule, candidate):
+        """ The device where the rule will write, or the source one when it doesn't move """
+        if not rule.to or not rule.config or not rule.config.get('target'):
+            return candidate.stat.st_dev
+        if rule not in self.rule_devices:
+            # the target folder may still not exist, take the first ancestor that does
+            path = os.path.abspath(os.path.join(rule.config['target'], rule.to))
+            while not os.path.exists(path) and os.path.dirname(path) != path:
+                path = os.path.dirname(path)
+            self.rule_devices[rule] = os.stat(path).st_dev
+        return self.rule_devices[rule]
+
+    def run(self, device, rule, candidate, future):
+        """ Apply the rule in a worker, then start the next operation waiting for the device """
+        try:
+            future.set_result(rule.apply(candidate, commit=self.commit,
+                                         target_lock=self.target_locks))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                pending = self.device_pending[device]
+                if pending:
+                    self.pool.submit(self.run, device, *pending.popleft())
+                else:
+                    self.device_running[device] -= 1
+                self.outstanding -= 1
+                if not self.outstanding:
+                    self.idle.notify_all()
+
+    def submit(self, rule, candidate):
+        """ Apply the rule to the candidate, return a Future with the ApplyResult """
+        future = Future()
+        if self.pool:
+            device = self.get_device(rule, candidate)
+            with self.lock:
+                self.outstanding += 1
+                pending = self.device_pending.setdefault(device, deque())
+                running = self.device_running.get(device, 0)
+                if running < self.device_workers:
+                    self.device_running[device] = running + 1
+                    self.pool.submit(self.run, device, rule, candidate, future)
+                else:
+                    pending.append((rule, candidate, future))
+            return future
+        try:
+            future.set_result(rule.apply(candidate, commit=self.commit))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self):
+        if self.pool:
+            with self.idle:  # the running operations may still submit the pending ones
+                while self.outstanding:
+                    self.idle.wait()
+            self.pool.shutdown(wait=True)
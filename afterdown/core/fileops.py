@@ -0,0 +1,198 @@
+from __future__ import unicode_literals
+
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+logger = logging.getLogger("afterdown.fileops")
+
+PART_SUFFIX = ".afterdown-part"  # a copy in progress, resumed when found
+PART_SOURCE_SUFFIX = ".afterdown-source"  # the signature of the source of the copy in progress
+CHUNK_SIZE = 16 * 1024 * 1024
+FALLOC_FL_KEEP_SIZE = 1
+FICLONE = 0x40049409  # the ioctl sharing the extents of a file (btrfs, xfs)
+
+_fallocate = False  # the libc fallocate, loaded on the first copy (None when missing)
+
+
+def get_fallocate():
+    """ Load fallocate from the libc the first time it is needed, not at each start """
+    global _fallocate
+    if _fallocate is False:
+        import ctypes
+        import ctypes.util
+        try:
+            _fallocate = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True).fallocate
+            _fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+        except (OSError, AttributeError, TypeError):
+            _fallocate = None
+    return _fallocate
+
+
+def same_device(source, target_folder):
+    return os.stat(source).st_dev == os.stat(target_folder).st_dev
+
+
+def preallocate(fd, offset, length):
+    """ Reserve the space for the copy, keeping the file size (it tells where to resume) """
+    fallocate = get_fallocate()
+    if fallocate is not None and length > 0:
+        fallocate(fd, FALLOC_FL_KEEP_SIZE, offset, length)  # just a hint, ignore failures
+
+
+def kernel_copy(source_fd, target_fd, offset, count):
+    """ Copy count bytes at offset in the kernel, without passing them through Python
+        return the bytes copied
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            return os.copy_file_range(source_fd, target_fd, count, offset, offset)
+        except OSError as e:
+            # not supported between these filesystems (or by this kernel)
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    os.lseek(target_fd, offset, os.SEEK_SET)
+    try:
+        return os.sendfile(target_fd, source_fd, offset, count)
+    except OSError as e:
+        if e.errno not in (errno.ENOSYS, errno.EINVAL):
+            raise
+    os.lseek(source_fd, offset, os.SEEK_SET)
+    return os.write(target_fd, os.read(source_fd, count))
+
+
+def file_checksum(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_signature(st):
+    """ What tells that a partial copy comes from the same source """
+    return [st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev]
+
+
+def part_source(source_path):
+    """ The signature of the source of a partial copy, None when we don't know it """
+    try:
+        with open(source_path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def copy_file(source, target, verify=False):
+    """ Copy source to target going through a partial file,
+        when a partial file of a previous copy of the same source is there (same size, mtime
+        and inode), the copy continues from where it stopped.
+        The target appears only when complete (and verified with a checksum when verify)
+    """
+    part_path = target + PART_SUFFIX
+    source_path = target + PART_SOURCE_SUFFIX
+    source_stat = os.stat(source)
+    size = source_stat.st_size
+    signature = source_signature(source_stat)
+    source_fd = os.open(source, os.O_RDONLY)
+    try:
+        # not in append mode: the kernel copy writes at a given offset
+        part_fd = os.open(part_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            part_stat = os.fstat(part_fd)
+            offset = part_stat.st_size
+            if offset and (offset > size or part_source(source_path) != signature):
+                # the partial file is not the beginning of this source, start again
+                os.ftruncate(part_fd, 0)
+                offset = 0
+            elif offset:
+                logger.info("Resuming the copy of %s from %d bytes" % (source, offset))
+            if not offset:
+                with open(source_path, 'w') as f:
+                    json.dump(signature, f)
+            preallocate(part_fd, offset, size - offset)
+            while offset < size:
+                copied = kernel_copy(source_fd, part_fd, offset, min(CHUNK_SIZE, size - offset))
+                if not copied:  # the source got shorter meanwhile
+                    raise IOError(errno.EIO, "%s changed while copying it" % source)
+                offset += copied
+            os.fsync(part_fd)  # the data is on disk before we remove the source
+        finally:
+            os.close(part_fd)
+    finally:
+        os.close(source_fd)
+    if verify and file_checksum(source) != file_checksum(part_path):
+        os.remove(part_path)
+        os.remove(source_path)
+        raise IOError(errno.EIO, "The copy of %s is different from the source" % source)
+    shutil.copystat(source, part_path)
+    os.rename(part_path, target)
+    os.remove(source_path)
+
+
+def move_file(source, target, verify=False):
+    """ Move a file: a rename when on the same filesystem, otherwise a resumable copy
+        done by the kernel, eventually verified, then the source is removed
+    """
+    if not os.path.islink(source) and same_device(source, os.path.dirname(target)):
+        try:
+            os.rename(source, target)
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:  # different mounts of the same filesystem
+                raise
+    if os.path.islink(source):
+        shutil.move(source, target)  # recreate the link, as shutil does
+        return
+    copy_file(source, target, verify=verify)
+    os.remove(source)
+
+
+def link_file(source, target):
+    """ Hardlink the source to the target, copying it when on another filesystem
+        the link is done on a temporary name, then it replaces the target (when it exists)
+    """
+    part_path = target + PART_SUFFIX
+    if os.path.lexists(part_path):
+        os.remove(part_path)  # left by an interrupted run
+    try:
+        os.link(source, part_path)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        logger.info("Cannot hardlink %s, copying it" % source)
+        copy_file(source, target)
+        return
+    os.replace(part_path, target)
+
+
+def reflink_file(source, target):
+    """ Clone the source to the target sharing the data blocks (copy on write),
+        copying it when the filesystem doesn't support reflinks
+    """
+    part_path = target + PART_SUFFIX
+    try:
+        with open(source, 'rb') as source_file, open(part_path, 'wb') as part_file:
+            fcntl.ioctl(part_file.fileno(), FICLONE, source_file.fileno())
+    except (IOError, OSError) as e:
+        if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL):
+            raise
+        logger.info("Cannot reflink %s, copying it" % source)
+        os.remove(part_path)
+        copy_file(source, target)
+        return
+    shutil.copystat(source, part_path)
+    os.rename(part_path, target)
+
+
+def already_placed(source, target):
+    """ True when the target is a link or a copy of the source done before """
+    if os.path.samefile(source, target):
+        return True
+    source_stat, target_stat = os.stat(source), os.stat(target)
+    return source_stat.st_size == target_stat.st_size \
+        and source_stat.st_mtime == target_stat.st_mtime
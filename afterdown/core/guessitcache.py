@@ -0,0 +1,72 @@
+from __future__ import unicode_literals
+
+from functools import lru_cache
+
+from afterdown.core.jsonstore import JsonStore
+
+GUESSIT_CACHE_SIZE = 4096  # the parses kept in memory
+
+
+class GuessitStore(JsonStore):
+    """ A persistent store of the guessit parses, so the files staying in the source
+        are not parsed again on each run.
+        The parses are keyed by filename, the whole store is discarded when guessit changes version.
+    """
+    description = "guessit cache"
+    stamp_key = "version"
+    entries_key = "parses"
+
+    def __init__(self, filepath, version=None):
+        super(GuessitStore, self).__init__(filepath, stamp=version)
+
+    @property
+    def stamp(self):
+        if self._stamp is None:
+            import guessit as guessit_module  # only when the store is used, it's slow
+            self._stamp = guessit_module.__version__
+        return self._stamp
+
+    def get(self, filename):
+        parse = self.data.get(filename)
+        if parse is not None:
+            self.newdata[filename] = parse
+        return parse
+
+    def put(self, filename, parse):
+        self.newdata[filename] = parse
+
+
+store = None  # the GuessitStore, when we keep it
+
+
+def set_store(guessit_store):
+    global store
+    store = guessit_store
+    guessit_parse.cache_clear()  # the memory cache should go through the store at least once
+
+
+def guessit(filename):
+    """ Parse the filename with guessit, imported the first time we need it (it's slow) """
+    from guessit import guessit as guessit_function
+    return guessit_function(filename)
+
+
+@lru_cache(maxsize=GUESSIT_CACHE_SIZE)
+def guessit_parse(filename):
+    """ The guessit fields we use for a filename (type, title and part)
+        parsed once and kept in memory, and in the GuessitStore when we have it
+    """
+    if store is not None:
+        parse = store.get(filename)
+        if parse is not None:
+            return parse
+    g = guessit(filename)
+    title = g.get('title', '')
+    parse = dict(
+        type=g.get('type'),
+        title=title if isinstance(title, str) else '',
+        part='part' in g,
+    )
+    if store is not None:
+        store.put(filename, parse)
+    return parse
@@ -0,0 +1,70 @@
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+
+logger = logging.getLogger("afterdown.jsonstore")
+
+
+class JsonStore(object):
+    """ A dictionary kept in a JSON file from a run to the next one.
+
+        The file has the entries and a stamp telling what they depend on
+        (ex. the rules fingerprint): with another stamp the entries are discarded.
+        data are the entries of the previous run, loaded when first used,
+        newdata the ones met in this run. The file is replaced atomically when saved.
+        The subclasses name the stamp and the entries in the file (stamp_key, entries_key)
+    """
+    description = "store"  # how we call it in the logs
+    stamp_key = "stamp"
+    entries_key = "entries"
+
+    def __init__(self, filepath, stamp=None):
+        self.filepath = filepath
+        self._stamp = stamp
+        self._data = None
+        self.newdata = {}  # the entries met or added in this run
+
+    @property
+    def stamp(self):
+        return self._stamp
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = {}
+            logger.debug("Loading %s" % self.filepath)
+            if os.path.isfile(self.filepath):
+                with open(self.filepath, 'r') as f:
+                    try:
+                        stored = json.load(f)
+                    except ValueError:
+                        stored = None
+                if not isinstance(stored, dict):
+                    logger.warning("The %s %s is corrupted, rebuilding it" %
+                                   (self.description, self.filepath))
+                    stored = {}
+                if stored.get(self.stamp_key) == self.stamp:
+                    self._data = stored.get(self.entries_key, {})
+                    logger.debug("%d entries in the %s" % (len(self._data), self.description))
+                elif stored:
+                    logger.info("The %s is outdated, rebuilding it" % self.description)
+        return self._data
+
+    def save(self, forget=True):
+        """ Save the entries met in this run, when forget the others are removed
+            a run that didn't use the store leaves it as it is
+        """
+        if self._data is None and not self.newdata:
+            return
+        entries = self.newdata
+        if not forget:
+            entries = dict(self.data, **entries)
+        if entries == self.data:
+            return
+        logger.debug("Saving to %s" % self.filepath)
+        temp_filepath = self.filepath + ".tmp"
+        with open(temp_filepath, 'w') as f:
+            json.dump({self.stamp_key: self.stamp, self.entries_key: entries}, f)
+        os.replace(temp_filepath, self.filepath)
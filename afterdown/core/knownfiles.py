@@ -1,8 +1,18 @@
 import logging
 import os
+import sqlite3
 
 logger = logging.getLogger("afterdown.knownfiles")
 
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+
+def open_known_files(filepath):
+    """ Return the known files store for filepath, a SQLite database when it has a db extension """
+    if os.path.splitext(filepath)[1].lower() in SQLITE_EXTENSIONS:
+        return KnownFilesDB(filepath)
+    return KnownFiles(filepath)
+
 
 class KnownFiles(object):
     """ A persistent storage to keep a list of already met files that didn't match
@@ -20,12 +30,63 @@ class KnownFiles(object):
                 self.data = set(map(str.strip, f.readlines()))
                 logger.debug("%d known files" % len(self.data))
 
-    def save(self):
+    def save(self, forget=True):
+        """ Save the asked files, when forget the files that weren't asked are removed """
+        if not forget:
+            self.newdata |= self.data
         if self.newdata != self.data:
             logger.debug("Saving to %s" % self.filepath)
-            with open(self.filepath, 'w') as f:
+            temp_filepath = self.filepath + ".tmp"
+            with open(temp_filepath, 'w') as f:
                 f.write("\n".join(sorted(self.newdata)))
+            os.replace(temp_filepath, self.filepath)
 
     def is_known(self, filename):
         self.newdata.add(filename)
         return filename in self.data
+
+
+class KnownFilesDB(object):
+    """ The known files kept in a SQLite database, for sources with many unknown files
+        Nothing is loaded at start: each question is an indexed lookup,
+        and saving writes only the files added and forgotten, in a single transaction.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.newdata = set()  # all the data asked
+        self.added = set()  # the asked files that weren't known
+        logger.debug("Opening %s" % self.filepath)
+        self.connection = sqlite3.connect(filepath)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS known (filename TEXT PRIMARY KEY) WITHOUT ROWID")
+
+    def save(self, forget=True):
+        """ Save the asked files, when forget the files that weren't asked are removed """
+        logger.debug("Saving to %s" % self.filepath)
+        with self.connection:  # commit all the changes or none
+            self.connection.executemany("INSERT OR IGNORE INTO known VALUES (?)",
+                                        ((filename,) for filename in self.added))
+            if forget:
+                self.connection.execute(
+                    "CREATE TEMP TABLE asked (filename TEXT PRIMARY KEY) WITHOUT ROWID")
+                self.connection.executemany("INSERT OR IGNORE INTO asked VALUES (?)",
+                                            ((filename,) for filename in self.newdata))
+                forgotten = self.connection.execute(
+                    "DELETE FROM known WHERE filename NOT IN (SELECT filename FROM asked)"
+                ).rowcount
+                self.connection.execute("DROP TABLE asked")
+                logger.debug("%d known files added, %d forgotten" % (len(self.added), forgotten))
+        self.added = set()
+        self.connection.close()
+
+    def is_known(self, filename):
+        self.newdata.add(filename)
+        if filename in self.added:
+            return False
+        known = self.connection.execute("SELECT 1 FROM known WHERE filename = ?",
+                                        (filename,)).fetchone()
+        if known is None:
+            self.added.add(filename)
+            return False
+        return True
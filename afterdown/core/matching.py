@@ -1,6 +1,8 @@
 import logging
 import re
 
+from afterdown.core.automaton import Automaton
+
 logger = logging.getLogger("afterdown.matching")
 
 
@@ -17,25 +19,35 @@ def justwords_case_insensitive_match(filename, match_string):
     return remove_special_chars(match_string).lower() in filename
 
 
+compiled_regexes = {}  # JS-style regex string: its compiled form (None when it's not a regex)
+
+
+def compile_js_regex(rx):
+    """ Return the compiled regex of a JS-style /query/flags string, None if it's not a regex
+        each string is compiled only once
+    """
+    try:
+        return compiled_regexes[rx]
+    except KeyError:
+        pass
+    compiled = None
+    if rx and rx[0] == "/":
+        query, params = rx.rsplit('/', 1)
+        if len(query) > 1:
+            compiled = re.compile(query[1:], flags=re.I if 'i' in params else 0)
+    compiled_regexes[rx] = compiled
+    return compiled
+
+
 def js_to_py_re(rx):
     """
     Derived from http://stackoverflow.com/questions/11230743/how-to-parse-a-javascript-regexp-in-python
     """
-    nonmatching_function = lambda s: False  # not a js regex form
-    if not rx or rx[0] != "/":
-        return nonmatching_function
-    query, params = rx.rsplit('/', 1)
-    if len(query) <= 1:
-        return nonmatching_function
-    else:
-        query = query[1:]
-    if 'g' in params:
-        obj = re.findall
-    else:
-        obj = re.search
-
-    # May need to make flags= smarter, but just an example...
-    return lambda f: obj(query, f, flags=re.I if 'i' in params else 0)
+    compiled = compile_js_regex(rx)
+    if compiled is None:
+        return lambda s: False  # not a js regex form
+    # a g flag means findall in JS, a match is enough for us
+    return compiled.search
 
 
 def regex_match(filename, match_string):
@@ -46,28 +58,113 @@ def regex_match(filename, match_string):
         return False
 
 
+def combine_regexes(regexes, flags):
+    """ Combine the compiled regexes in a single one: matched at the start of a text,
+        each named group is set when its regex is found in the text.
+        Return None when they can't be combined
+    """
+    alternatives = ["(?:(?=[\\s\\S]*?(?P<r%d>%s))|)" % (index, regex.pattern)
+                    for index, regex in enumerate(regexes)]
+    try:
+        return re.compile("".join(alternatives), flags=flags)
+    except re.error:  # ex. inline flags in the middle of the pattern
+        return None
+
+
+# feature is the Candidate attribute with the prepared filepath
+# the tests with prepare_match are substring tests,
+# done by the MatchEngine for all the rules at once
 MATCH_TESTS = [
-    dict(confidence=100, match_func=regex_match),
+    dict(confidence=100, match_func=regex_match, feature='filepath', regex=True),
     dict(confidence=100, match_func=full_case_insensitive_match,
-         prepare_filepath=lambda x: x.lower()),
+         prepare_filepath=lambda x: x.lower(), feature='lower_path',
+         prepare_match=lambda x: x.lower()),
     dict(confidence=80, match_func=justwords_case_insensitive_match,
-         prepare_filepath=lambda x: remove_special_chars(x).lower()),
+         prepare_filepath=lambda x: remove_special_chars(x).lower(), feature='words_path',
+         prepare_match=lambda x: remove_special_chars(x).lower()),
 ]
 
 
-def try_match_strings(candidate, matches, max_priority):
+class MatchEngine(object):
+    """ All the match strings of the rules, compiled in an automaton for each substring test:
+        the candidate path is scanned once for each test, finding all the strings it contains.
+        The regexes are combined in a single regex for each flag set,
+        the ones with groups (maybe referenced inside) are searched one by one
+    """
+
+    def __init__(self, match_strings):
+        self.tiers = []  # (confidence, feature, automaton, {prepared: [match strings]})
+        self.combined = []  # (confidence, feature, combined regex, [match strings])
+        self.regexes = []  # (confidence, feature, regex, match string)
+        for mt in MATCH_TESTS:
+            if mt.get('regex'):
+                self.add_regexes(mt, match_strings)
+                continue
+            prepared = {}
+            for match_string in match_strings:
+                prepared.setdefault(mt['prepare_match'](match_string), []).append(match_string)
+            self.tiers.append((mt['confidence'], mt['feature'], Automaton(prepared), prepared))
+
+    def add_regexes(self, mt, match_strings):
+        by_flags = {}
+        for match_string in sorted(match_strings):
+            regex = compile_js_regex(match_string)
+            if regex is None:
+                continue
+            if regex.groups:
+                self.regexes.append((mt['confidence'], mt['feature'], regex, match_string))
+            else:
+                by_flags.setdefault(regex.flags, []).append((regex, match_string))
+        for flags, regexes in by_flags.items():
+            combined = combine_regexes([regex for regex, match_string in regexes], flags)
+            if combined is None:
+                for regex, match_string in regexes:
+                    self.regexes.append((mt['confidence'], mt['feature'], regex, match_string))
+            else:
+                self.combined.append((mt['confidence'], mt['feature'], combined,
+                                      [match_string for regex, match_string in regexes]))
+
+    def hits(self, candidate):
+        """ Return a dictionary with the max confidence
+            of the match strings found in the candidate
+        """
+        hits = {}
+        for confidence, feature, automaton, prepared in self.tiers:
+            for pattern in automaton.search(getattr(candidate, feature)):
+                for match_string in prepared[pattern]:
+                    if hits.get(match_string, 0) < confidence:
+                        hits[match_string] = confidence
+        for confidence, feature, combined, regex_strings in self.combined:
+            found = combined.match(getattr(candidate, feature))
+            for index, match_string in enumerate(regex_strings):
+                if found.group(index + 1) is not None and hits.get(match_string, 0) < confidence:
+                    hits[match_string] = confidence
+        for confidence, feature, regex, match_string in self.regexes:
+            if hits.get(match_string, 0) < confidence and regex.search(getattr(candidate, feature)):
+                hits[match_string] = confidence
+        return hits
+
+
+def try_match_strings(candidate, matches, max_priority, hits=None):
     """
         Check the match with various level of confidency, degrading the priority
         an exact contain match gives full priority, a contain ignoring [\s\.-_] gives 20% less confidence...
+        hits are the substring tests already done by the MatchEngine, when available
     """
+    if hits is not None:
+        return try_match_hits(candidate, matches, max_priority, hits)
+    if isinstance(candidate, dict):
+        filepath = candidate['filepath']
+        prepared_filepaths = [mt['prepare_filepath'](filepath) if 'prepare_filepath' in mt
+                              else filepath
+                              for mt in MATCH_TESTS]
+    else:  # a Candidate, with its prepared forms cached
+        prepared_filepaths = [getattr(candidate, mt['feature']) for mt in MATCH_TESTS]
     result = 0
     for match_string in matches:
         string_confidence = 0
         match = False
-        for mt in MATCH_TESTS:
-            filepath = candidate['filepath']
-            if 'prepare_filepath' in mt:
-                filepath = mt['prepare_filepath'](filepath)
+        for mt, filepath in zip(MATCH_TESTS, prepared_filepaths):
             if mt['match_func'](filepath, match_string):
                 match = True
                 string_confidence = max(string_confidence, max_priority * mt['confidence'] // 100)
@@ -77,3 +174,14 @@ def try_match_strings(candidate, matches, max_priority):
         else:
             result = max(result, string_confidence)
     return result
+
+
+def try_match_hits(candidate, matches, max_priority, hits):
+    """ As try_match_strings, with all the tests already done by the MatchEngine """
+    result = 0
+    for match_string in matches:
+        confidence = hits.get(match_string, 0)
+        if not confidence:
+            return False
+        result = max(result, max_priority * confidence // 100)
+    return result
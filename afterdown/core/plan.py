@@ -0,0 +1,139 @@
+from __future__ import unicode_literals
+
+import time
+
+REORDER_EVERY = 500  # evaluations between the reorders of a plan
+
+
+class Predicate(object):
+    """ A check of a rule: check(candidate, hits) returns False when the candidate is rejected.
+        cost is the estimated cost of a call, replaced by the measured one when we have it.
+        A last predicate is evaluated after all the others (ex. an expensive guessit parse).
+        Predicates with the same key give the same result (ex. the extensions of a common type):
+        it is computed once for each candidate and shared by all the rules
+    """
+    __slots__ = ('name', 'check', 'cost', 'last', 'key', 'calls', 'rejected', 'elapsed', 'reused')
+
+    def __init__(self, name, check, cost, last=False, key=None):
+        self.name = name
+        self.check = check
+        self.cost = cost
+        self.last = last
+        self.key = key
+        self.calls = 0
+        self.rejected = 0
+        self.elapsed = 0.0
+        self.reused = 0  # the results taken from another rule evaluation
+
+    def evaluate(self, candidate, hits):
+        """ The predicate result, reusing the one computed by another rule when shared """
+        key = self.key
+        if key is not None:
+            shared = candidate.shared
+            if key in shared:
+                self.reused += 1
+                return shared[key]
+        start = time.perf_counter()
+        result = self.check(candidate, hits)
+        self.elapsed += time.perf_counter() - start
+        if key is not None:
+            shared[key] = result
+        return result
+
+    @property
+    def average_cost(self):
+        computed = self.calls - self.reused
+        return self.elapsed / computed if computed else self.cost
+
+    @property
+    def rejection_rate(self):
+        # without measures we suppose it rejects half of the candidates
+        return float(self.rejected) / self.calls if self.calls else 0.5
+
+    @property
+    def rank(self):
+        """ The expected cost to reject a candidate, the lower the earlier it's evaluated """
+        return self.average_cost / max(self.rejection_rate, 0.001)
+
+    def __repr__(self):
+        return "%s: %d calls, %.0f%% rejected, %.1fus" % (
+            self.name, self.calls, self.rejection_rate * 100, self.average_cost * 1e6)
+
+
+class EvaluationPlan(object):
+    """ The predicates of a rule, evaluated in the order that rejects a candidate cheaply:
+        every REORDER_EVERY evaluations, the order is updated with the measured
+        cost and selectivity of each predicate
+    """
+
+    def __init__(self, predicates):
+        self.predicates = predicates
+        self.evaluations = 0
+        self.matched = 0  # the evaluations accepted by all the predicates
+        self.reorder()
+
+    def reorder(self):
+        self.predicates = sorted(self.predicates,
+                                 key=lambda predicate: (predicate.last, predicate.rank))
+
+    def evaluate(self, candidate, hits=None):
+        """ Return False when a predicate rejects the candidate,
+            otherwise a dictionary with the result of each predicate
+        """
+        self.evaluations += 1
+        if self.evaluations % REORDER_EVERY == 0:
+            self.reorder()
+        results = {}
+        for predicate in self.predicates:
+            result = predicate.evaluate(candidate, hits)
+            predicate.calls += 1
+            if result is False:
+                predicate.rejected += 1
+                return False
+            results[predicate.name] = result
+        self.matched += 1
+        return results
+
+    def evaluate_many(self, candidates, hits=None, columns=None, rows=None):
+        """ As evaluate, for a chunk of candidates: each predicate is evaluated on all the
+            candidates still accepted, then the next one. Return a list with the results
+            the predicates supported by the columns (CandidateColumns) are vectorized,
+            rows are the indexes of the candidates in the columns
+        """
+        evaluations = self.evaluations + len(candidates)
+        if self.evaluations // REORDER_EVERY != evaluations // REORDER_EVERY:
+            self.reorder()
+        self.evaluations = evaluations
+        results = [{} for candidate in candidates]
+        accepted = range(len(candidates))
+        for predicate in self.predicates:
+            name = predicate.name
+            if columns is not None and columns.supports(predicate):
+                start = time.perf_counter()
+                mask = columns.predicate_mask(predicate, [rows[index] for index in accepted])
+                predicate.elapsed += time.perf_counter() - start
+                still_accepted = [index for index, ok in zip(accepted, mask) if ok]
+                for index in still_accepted:
+                    results[index][name] = True
+            else:
+                evaluate = predicate.evaluate
+                still_accepted = []
+                for index in accepted:
+                    result = evaluate(candidates[index], hits[index] if hits else None)
+                    if result is not False:
+                        results[index][name] = result
+                        still_accepted.append(index)
+            predicate.calls += len(accepted)
+            predicate.rejected += len(accepted) - len(still_accepted)
+            accepted = still_accepted
+            if not accepted:
+                break
+        self.matched += len(accepted)
+        accepted = set(accepted)
+        return [result if index in accepted else False for index, result in enumerate(results)]
+
+    def __iter__(self):
+        return iter(self.predicates)
+
+    def __repr__(self):
+        return "Plan: %s" % ", ".join(predicate.name for predicate in self.predicates)
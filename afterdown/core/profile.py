@@ -0,0 +1,56 @@
+from __future__ import unicode_literals
+
+import json
+
+
+def rules_profile(ruleset):
+    """ Return the statistics of each rule of the ruleset, the most expensive first """
+    profile = []
+    for position, rule in enumerate(ruleset.rules):
+        plan = rule.plan
+        predicates = {predicate.name: dict(calls=predicate.calls,
+                                           rejected=predicate.rejected,
+                                           reused=predicate.reused,
+                                           seconds=predicate.elapsed)
+                      for predicate in plan}
+        profile.append(dict(
+            position=position,
+            rule="%s" % rule,
+            evaluations=plan.evaluations,
+            seconds=sum(predicate.elapsed for predicate in plan),
+            predicates=predicates,
+            matched=plan.matched,
+            wins=ruleset.wins[position],
+        ))
+    profile.sort(key=lambda stats: (-stats['seconds'], stats['position']))
+    return profile
+
+
+def format_profile(profile, width=60):
+    """ A text report of the rules profile, one line for each rule """
+    lines = ["%4s %8s %9s %8s %6s  %-*s  %s" % ("#", "evals", "ms", "matched", "wins",
+                                                width, "rule", "predicates (ms)")]
+    for stats in profile:
+        rule = stats['rule']
+        if len(rule) > width:
+            rule = rule[:width - 3] + "..."
+        predicates = ", ".join(
+            "%s %.3f" % (name, predicate['seconds'] * 1000)
+            for name, predicate in sorted(stats['predicates'].items(),
+                                          key=lambda item: -item[1]['seconds'])
+        )
+        lines.append("%4d %8d %9.3f %8d %6d  %-*s  %s" % (
+            stats['position'], stats['evaluations'], stats['seconds'] * 1000,
+            stats['matched'], stats['wins'], width, rule, predicates,
+        ))
+    dead = [stats for stats in profile if stats['evaluations'] and not stats['wins']]
+    if dead:
+        lines.append("%d rules never applied: %s" % (
+            len(dead), ", ".join("#%d" % stats['position']
+                                 for stats in sorted(dead, key=lambda stats: stats['position']))))
+    return "\n".join(lines)
+
+
+def export_profile(profile, filepath):
+    with open(filepath, 'w') as f:
+        json.dump(profile, f, indent=2)
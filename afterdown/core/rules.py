@@ -1,13 +1,13 @@
 from __future__ import print_function, unicode_literals
 
+import hashlib
 import logging
 import os
 import random
-import shutil
 from collections import defaultdict
+from contextlib import nullcontext
 
-from afterdown.core.utils import guessit_video_type, guessit_video_title
-from subliminal.core import save_subtitles
+from afterdown.core.utils import video_type, guessit_video_title
 
 try:
     from html import escape
@@ -15,8 +15,9 @@ except ImportError:
     from cgi import escape
 
 from afterdown.core.constants import OPERATORS_MAP, AttrDict
-from afterdown.core.matching import try_match_strings
-from afterdown.core.season_info import get_episode_infos
+from afterdown.core.fileops import move_file, link_file, reflink_file, already_placed
+from afterdown.core.matching import try_match_strings, compile_js_regex
+from afterdown.core.plan import Predicate, EvaluationPlan
 
 logger = logging.getLogger("afterdown.rules")
 
@@ -78,6 +79,10 @@ class Rule(object):
     ACTION_MOVE = "MOVE"  # move the file to a position
     ACTION_DELETE = "DELETE"  # delete the file, use with caution
     ACTION_SKIP = "SKIP"  # don't do nothing, just keep the file there
+    ACTION_LINK = "LINK"  # hardlink the file to a position, keeping it also in the source
+    ACTION_REFLINK = "REFLINK"  # as LINK, but with a copy on write clone of the file
+    # the actions putting the file in the target
+    TARGET_ACTIONS = (ACTION_MOVE, ACTION_LINK, ACTION_REFLINK)
 
     # some fictional action, they don't do nothing, but can be used for not-rule-action
     ACTION_DOWNLOAD = "DOWNLOAD"
@@ -128,6 +133,7 @@ class Rule(object):
         self.addTitle = False
 
         self.config = config
+        self._plan = None  # the EvaluationPlan, prepared when first needed
 
         # add the singular forms, that are sometime more practical
         for singular_form, plural_form in (('match', 'matches'),
@@ -156,6 +162,8 @@ class Rule(object):
             if key in rule_def:
                 value = rule_def[key]
                 self.add_field(key, value)
+        for match_string in self.matches:
+            compile_js_regex(match_string)  # compile the regexes once, failing early when invalid
 
         if self.action == "delete":
             self.action = self.ACTION_DELETE
@@ -163,9 +171,14 @@ class Rule(object):
             self.action = self.ACTION_MOVE
         elif self.action == "skip":
             self.action = self.ACTION_SKIP
+        elif self.action == "link":
+            self.action = self.ACTION_LINK
+        elif self.action == "reflink":
+            self.action = self.ACTION_REFLINK
 
         assert self.action in (
-            self.ACTION_MOVE, self.ACTION_DELETE, self.ACTION_SKIP
+            self.ACTION_MOVE, self.ACTION_DELETE, self.ACTION_SKIP,
+            self.ACTION_LINK, self.ACTION_REFLINK,
         ), "Unknown action %s" % self.action
         self.add_field('name', name)
 
@@ -187,7 +200,7 @@ class Rule(object):
         """
         for key in self.fields:
             parent_value = getattr(parent_rule, key)
-            self.add_field(key, parent_value)
+            self.add_field(key, parent_value, normalized=True)  # the parent already normalized it
 
     def add_field(self, key, value, normalized=False):
         """ add the value to the key field, if not normalized the value will be normalized """
@@ -204,52 +217,78 @@ class Rule(object):
                 value = normalize_field(key, value)
             setattr(self, key, value)
 
-    def match(self, candidate):
-        # candidate is a dictionary with property of a candidate file:
-        # for sure there are: filepath (relative path), and fullpath (absolute)
-        confidence = self.priority
+    def get_plan(self):
+        """ The evaluation plan with the predicates of this rule,
+            the costs are estimates: the plan measures them when used
+        """
+        predicates = []
+        # the predicates inherited from a common type have the same key, and are shared
         if self.extensions:
-            if "extension" not in candidate:
-                extension = os.path.splitext(candidate['filepath'])[1]
-                if extension:
-                    extension = extension[
-                                1:].lower()  # get the extension lowercased without the initial dot
-                candidate["extension"] = extension
-            if not candidate['extension'] in self.extensions:
-                # logger.debug("Rejected rule %s for extension" % self)
-                return False
+            predicates.append(Predicate("extension", self.match_extension, cost=1e-7,
+                                        key=("extension", frozenset(self.extensions))))
         if self.matches:
-            confidence = try_match_strings(candidate=candidate,
-                                           matches=self.matches,
-                                           max_priority=self.priority)
-            if confidence is False:  # no string match, stop here
-                return False
+            predicates.append(Predicate("matches", self.match_strings, cost=1e-6))
         if self.size is not None:
-            if "size" not in candidate:
-                candidate['size'] = os.path.getsize(
-                    candidate['fullpath'].encode('utf-8')
-                )
-            size = candidate["size"]
-            operator, threshold = self.size  # size is a tuple with operator (=, <, >) and size in bytes
-            operator_function = OPERATORS_MAP[operator]
-            if not operator_function(size, threshold):
-                # logger.debug("Rejected rule {rule} for size: {size}{operator}{threshold}".format(
-                #     rule=self,
-                #     size=size,
-                #     operator=operator,
-                #     threshold=threshold,
-                # ))
-                return False
-
+            predicates.append(Predicate("size", self.match_size, cost=1e-5,  # maybe a stat
+                                        key=("size",) + tuple(self.size)))
         if self.foundType:
-            filename = os.path.basename(candidate['filepath'])
-            guessed_type = guessit_video_type(filename)
-            if self.foundType != guessed_type:
-                return False
+            # maybe a guessit parse, whatever it costs it comes after the others
+            predicates.append(Predicate("foundType", self.match_found_type, cost=1e-2, last=True,
+                                        key=("foundType", self.foundType)))
+        return EvaluationPlan(predicates)
 
-        return confidence
-
-    def apply(self, candidate, commit=True):
+    @property
+    def plan(self):
+        if self._plan is None:
+            self._plan = self.get_plan()
+        return self._plan
+
+    def match_extension(self, candidate, hits=None):
+        return candidate.extension in self.extensions
+
+    def match_strings(self, candidate, hits=None):
+        return try_match_strings(candidate=candidate,
+                                 matches=self.matches,
+                                 max_priority=self.priority,
+                                 hits=hits)
+
+    def match_size(self, candidate, hits=None):
+        operator, threshold = self.size  # size is a tuple with operator (=, <, >) and size in bytes
+        operator_function = OPERATORS_MAP[operator]
+        return operator_function(candidate.size, threshold)
+
+    def match_found_type(self, candidate, hits=None):
+        # the guessed type is shared also by the rules looking for another type
+        shared = candidate.shared
+        if "videoType" not in shared:
+            shared["videoType"] = video_type(candidate.basename)
+        return self.foundType == shared["videoType"]
+
+    def match(self, candidate, hits=None):
+        # candidate is a Candidate, with the properties of a file:
+        # filepath (relative path), fullpath (absolute) and the features computed when needed
+        # hits are the match strings found in the candidate by the MatchEngine (when available)
+        # the predicates are evaluated in the order of the plan,
+        # the cheapest and most selective first
+        results = self.plan.evaluate(candidate, hits)
+        if results is False:
+            return False
+        return results.get("matches", self.priority)
+
+    def match_many(self, candidates, hits=None, columns=None, rows=None):
+        """ Match a chunk of candidates, returning the list of their confidence (False if rejected)
+            hits is the list with the MatchEngine hits of each candidate (when available)
+            columns are the CandidateColumns of the batch, with the rows of the candidates
+        """
+        default = self.priority
+        evaluated = self.plan.evaluate_many(candidates, hits, columns=columns, rows=rows)
+        return [results if results is False else results.get("matches", default)
+                for results in evaluated]
+
+    def apply(self, candidate, commit=True, target_lock=None):
+        """ Apply the rule action to the candidate, returning an ApplyResult
+            target_lock(path) gives a lock for the target path, when applying in parallel
+        """
         # print "{action} {filepath} {to}".format(action=self.action, filepath=candidate['filepath'], to=[self.to])
         # the object I will return
         result = ApplyResult(
@@ -257,71 +296,91 @@ class Rule(object):
             action=self.action,
             actionName=self.actionName,
             candidate=candidate,
-            filepath=candidate['filepath'],
+            filepath=candidate.filepath,
             sub_downloaded=self.downloadSubtitles,
         )
         if self.action == self.ACTION_DELETE:
             if commit:
                 try:
-                    os.remove(candidate['fullpath'])
+                    os.remove(candidate.fullpath)
                 except OSError as e:
                     logger.error(
-                        "Error deleting {filename}. {error}".format(filename=candidate['filepath'],
+                        "Error deleting {filename}. {error}".format(filename=candidate.filepath,
                                                                     error=e))
         elif self.action == self.ACTION_SKIP:
             pass
-        elif self.action == self.ACTION_MOVE:
-            assert self.to, "When MOVE you have to specify the destination with the 'to' parameter."
+        elif self.action in self.TARGET_ACTIONS:
+            assert self.to, "When %s you have to specify the destination with the 'to' parameter." \
+                            % self.action
             to = self.to
             if self.addTitle:
                 # we add the detected serie title from to the destination
-                filename = os.path.basename(candidate['filepath'])
-                title = guessit_video_title(filename)
+                title = guessit_video_title(candidate.basename)
                 if title:
                     to = os.path.join(to, title)
             if self.seasonSplit:
-                season, episode = get_episode_infos(candidate['filepath'])
+                season, episode = candidate.episode_infos
                 if season:
                     to = os.path.join(to, "S%s" % season)
             if self.folderSplit:
                 # put the file in a subfolder with the name of the file (without extension)
-                folder_name = os.path.splitext(os.path.basename(candidate['filepath']))[0]
+                folder_name = os.path.splitext(candidate.basename)[0]
                 to = os.path.join(to, folder_name)
             assert self.config and self.config['target'], \
                 "Applying needs that rules have a configuration, with its target"
 
             full_target = os.path.join(self.config['target'], to)
-            filename = os.path.basename(candidate['fullpath'])
+            filename = candidate.basename
             if commit:
                 if not os.path.exists(full_target):
                     logger.info("Creating folder %s" % full_target)
-                    os.makedirs(full_target)  # ensure the target folder is there
-                while os.path.isfile(os.path.join(full_target, filename)):
-                    logger.warning("File %s already exist on %s" % (filename, to))
-                    if self.overwrite == "skip":
-                        logger.warning("Skipping this file")
+                    # ensure the target folder is there (it may be created meanwhile by a worker)
+                    os.makedirs(full_target, exist_ok=True)
+                # when applying in parallel, one file at a time can look for its target name
+                lock = target_lock(os.path.join(full_target, filename)) if target_lock \
+                    else nullcontext()
+                with lock:
+                    if self.action != self.ACTION_MOVE \
+                        and os.path.isfile(os.path.join(full_target, filename)) \
+                        and already_placed(candidate.fullpath, os.path.join(full_target, filename)):
+                        # the source stays there, we linked it in a previous run
+                        logger.debug("%s is already on %s" % (filename, to))
                         result['action'] = self.ACTION_SKIP
+                        result['already_placed'] = True
                         return result
-                    elif self.overwrite == "overwrite":
-                        logger.info("Overwriting")
-                        break
-                    elif self.overwrite == "rename":
-                        filename = os.path.basename(candidate['fullpath'])
-                        name, ext = os.path.splitext(filename)
-                        filename = name + "_%s" % str(random.randint(0, 10000)).zfill(5) + ext
+                    while os.path.isfile(os.path.join(full_target, filename)):
+                        logger.warning("File %s already exist on %s" % (filename, to))
+                        if self.overwrite == "skip":
+                            logger.warning("Skipping this file")
+                            result['action'] = self.ACTION_SKIP
+                            return result
+                        elif self.overwrite == "overwrite":
+                            logger.info("Overwriting")
+                            break
+                        elif self.overwrite == "rename":
+                            filename = candidate.basename
+                            name, ext = os.path.splitext(filename)
+                            filename = name + "_%s" % str(random.randint(0, 10000)).zfill(5) + ext
+                        else:
+                            raise Exception("Invalid overwrite value: %s" % self.overwrite)
+                    full_target_path = os.path.join(full_target, filename)
+                    # a failed link raises: the source stays, the action is not done
+                    if self.action == self.ACTION_LINK:
+                        link_file(candidate.fullpath, full_target_path)
+                    elif self.action == self.ACTION_REFLINK:
+                        reflink_file(candidate.fullpath, full_target_path)
                     else:
-                        raise Exception("Invalid overwrite value: %s" % self.overwrite)
-                full_target_path = os.path.join(full_target, filename)
-                try:
-                    shutil.move(candidate['fullpath'], full_target_path)
-                except OSError as e:
-                    logger.error(
-                        "Error moving {filename}. {error}".format(filename=candidate['filepath'],
-                                                                  error=e))
+                        try:
+                            move_file(candidate.fullpath, full_target_path,
+                                      verify=self.config.get('verifyMoves', False))
+                        except OSError as e:
+                            logger.error(
+                                "Error moving {filename}. {error}".format(
+                                    filename=candidate.filepath, error=e))
 
             else:
                 # no commit so return the name as the file is not on target
-                filename = os.path.basename(candidate['fullpath'])
+                filename = candidate.basename
                 full_target_path = os.path.join(full_target, filename)
             result['target_fullpath'] = full_target_path
             result['target_filepath'] = full_target_path[len(self.config['target']) + 1:]
@@ -329,6 +388,7 @@ class Rule(object):
             if self.downloadSubtitles:
                 filename = os.path.basename(result['target_fullpath'])
                 from subliminal import download_best_subtitles, Video
+                from subliminal.core import save_subtitles
                 from babelfish import Language
                 print("Scanning subtitles for {filename} in {languages}".format(
                     filename=filename, languages=self.downloadSubtitles
@@ -346,6 +406,14 @@ class Rule(object):
         return result
 
 
+def rules_fingerprint(rules, target=None):
+    """ A digest of the prepared rules (with their inherited types), it changes when
+        the result of a classification could change
+    """
+    definition = "\n".join(["%s" % target] + ["%r" % rule for rule in rules])
+    return hashlib.sha1(definition.encode('utf-8')).hexdigest()
+
+
 # LATER: the size rule, ad example moving films if their size is >500M,
 #  should move also the subtitles with same name?
 
@@ -360,10 +428,13 @@ class ApplyResult(AttrDict):
     actionName = None
     filepath = None
     fullpath = None
-    target_fullpath = None  # populated in MOVE action (the full path of move target)
+    target_fullpath = None  # populated in MOVE/LINK actions (the full path of the target)
     target_filepath = None  # as fullpath, but path is relative to the target folder
+    already_placed = False  # a LINK found its target already linked
     CLASSES = {
         Rule.ACTION_MOVE: "move",
+        Rule.ACTION_LINK: "move",
+        Rule.ACTION_REFLINK: "move",
         Rule.ACTION_DELETE: "delete",
         Rule.ACTION_DOWNLOAD: "download",
         Rule.ACTION_UNKNOWN: "unrecognized",
@@ -373,7 +444,7 @@ class ApplyResult(AttrDict):
     def __unicode__(self):
         result = "{action}: {filepath}".format(action=self.actionName or self.action,
                                                filepath=self.filepath)
-        if self.action == Rule.ACTION_MOVE:
+        if self.action in Rule.TARGET_ACTIONS:
             result += " to: %s" % self.target_filepath
         return result
 
@@ -389,7 +460,7 @@ class ApplyResult(AttrDict):
         tokens.append("%s<b>%s</b>" % (
             escape(dirname), escape(filename),
         ))
-        if self.action == Rule.ACTION_MOVE:
+        if self.action in Rule.TARGET_ACTIONS:
             tokens.append(escape(os.path.dirname(self.target_filepath)))
         return tokens
 
@@ -0,0 +1,226 @@
+from __future__ import unicode_literals
+
+import logging
+from collections import defaultdict
+
+from afterdown.core import columnar
+from afterdown.core.columnar import CandidateColumns
+from afterdown.core.matching import MatchEngine
+
+logger = logging.getLogger("afterdown.ruleset")
+
+
+class Decision(object):
+    """ The result of the classification of a candidate
+        matches is the list of (confidence, rule) of the matching rules,
+        top are the rules with the max confidence: when there is only one, it's the rule to apply
+    """
+    __slots__ = ('candidate', 'matches', 'top')
+
+    def __init__(self, candidate, matches, top):
+        self.candidate = candidate
+        self.matches = matches
+        self.top = top
+
+    @property
+    def rule(self):
+        """ The rule to apply, None when the candidate is unknown or unsure """
+        return self.top[0] if len(self.top) == 1 else None
+
+    @property
+    def unsure(self):
+        return len(self.top) > 1
+
+
+def confidence_bound(rule):
+    """ The max confidence a rule can give: its priority, or 0 when a match string is needed
+        (the strings confidence is never below 0)
+    """
+    if rule.matches:
+        return max(rule.priority, 0)
+    return rule.priority
+
+
+class RuleSet(object):
+    """ The prepared rules, classifying the candidates
+
+        The rules are indexed by extension: a candidate is evaluated only against the rules
+        accepting its extension and the ones accepting any extension, in the rules order.
+        The match strings of all the rules are searched at once by the MatchEngine.
+
+        A rule confidence can't be more than its priority: the rules are evaluated from the
+        highest priority, stopping when the remaining ones can't reach the best confidence found.
+        With a DecisionCache, the decision of an unchanged file is reused.
+    """
+
+    def __init__(self, rules, cache=None):
+        self.rules = rules
+        self.cache = cache  # the DecisionCache, when we keep it
+        self.positions = {id(rule): position for position, rule in enumerate(rules)}
+        self.wins = defaultdict(int)  # rule position: how many times it was the rule to apply
+        self.any_extension = []  # the (position, rule) of the rules without extensions
+        self.by_extension = {}  # extension: the (position, rule) of the rules accepting it
+        for position, rule in enumerate(rules):
+            if rule.extensions:
+                for extension in rule.extensions:
+                    self.by_extension.setdefault(extension, []).append((position, rule))
+            else:
+                self.any_extension.append((position, rule))
+        self.bucket_cache = {}  # extension: the rules to evaluate, merged in order
+        self.bounded_cache = {}  # extension: the (bound, position, rule) by decreasing bound
+        self.engine = MatchEngine({match_string for rule in rules for match_string in rule.matches})
+        # the predicates with the same key are nodes shared by many rules, evaluated once
+        self.shared_predicates = defaultdict(list)  # predicate key: the rules using it
+        for rule in rules:
+            for predicate in rule.plan:
+                if predicate.key is not None:
+                    self.shared_predicates[predicate.key].append(rule)
+        shared = [key for key, key_rules in self.shared_predicates.items() if len(key_rules) > 1]
+        if shared:
+            logger.debug("%d predicates shared by many rules" % len(shared))
+
+    def get_rules(self, extension):
+        """ Return the rules that can accept a candidate with this extension """
+        rules = self.bucket_cache.get(extension)
+        if rules is None:
+            bucket = self.by_extension.get(extension, []) + self.any_extension
+            rules = tuple(rule for position, rule in sorted(bucket, key=lambda item: item[0]))
+            self.bucket_cache[extension] = rules
+        return rules
+
+    def get_bounded_rules(self, extension):
+        """ Return the (bound, position, rule) of the rules that can accept the extension
+            from the highest confidence bound, in the rules order when the bounds are the same
+        """
+        bounded = self.bounded_cache.get(extension)
+        if bounded is None:
+            bounded = tuple(sorted(
+                ((confidence_bound(rule), position, rule)
+                 for position, rule in enumerate(self.get_rules(extension))),
+                key=lambda item: (-item[0], item[1])
+            ))
+            self.bounded_cache[extension] = bounded
+        return bounded
+
+    def get_matches(self, candidate, prune=False):
+        """ Return the list of (confidence, rule) of the rules matching the candidate
+            in the rules order. When prune, only the rules that can reach the max confidence
+            are evaluated: the others are not in the list
+        """
+        matches = []
+        hits = None
+        best = 0  # the max confidence starts from 0, lower confidences are never chosen
+        for bound, position, rule in self.get_bounded_rules(candidate.extension):
+            if prune and bound < best:
+                break  # the next ones have a lower bound, they can't reach (or tie) the best
+            if rule.matches and hits is None:
+                hits = self.engine.hits(candidate)  # only when some rule needs them
+            confidence = rule.match(candidate, hits=hits)
+            if confidence is not False:
+                matches.append((position, confidence, rule))
+                best = max(best, confidence)
+        matches.sort(key=lambda item: item[0])
+        return [(confidence, rule) for position, confidence, rule in matches]
+
+    def get_matches_many(self, candidates, extension):
+        """ As get_matches with prune, for a chunk of candidates with the same extension:
+            each rule is evaluated at once on all the candidates that can still choose it
+        """
+        matches = [[] for candidate in candidates]
+        hits = [None] * len(candidates)
+        best = [0] * len(candidates)
+        columns = None
+        if len(candidates) >= columnar.COLUMNAR_MIN_BATCH and columnar.get_numpy():
+            # the size checks are vectorized, on the rows that reach them
+            columns = CandidateColumns(candidates)
+        for bound, position, rule in self.get_bounded_rules(extension):
+            active = [index for index in range(len(candidates)) if bound >= best[index]]
+            if not active:
+                break  # no candidate can choose the next rules
+            if rule.matches:
+                for index in active:
+                    if hits[index] is None:
+                        hits[index] = self.engine.hits(candidates[index])
+            results = rule.match_many([candidates[index] for index in active],
+                                      hits=[hits[index] for index in active],
+                                      columns=columns, rows=active)
+            for index, confidence in zip(active, results):
+                if confidence is not False:
+                    matches[index].append((position, confidence, rule))
+                    best[index] = max(best[index], confidence)
+        return [[(confidence, rule) for position, confidence, rule in
+                 sorted(candidate_matches, key=lambda item: item[0])]
+                for candidate_matches in matches]
+
+    def classify(self, candidate):
+        decision = self.cached_decision(candidate)
+        if decision is None:
+            decision = self.decide(candidate)
+            self.cache_decision(decision)
+        self.count_win(decision)
+        return decision
+
+    def count_win(self, decision):
+        if decision.rule:
+            self.wins[self.positions[id(decision.rule)]] += 1
+
+    def classify_batch(self, candidates):
+        """ Classify a chunk of candidates, returning their decisions in the same order
+            the candidates are grouped by extension, and each rule is evaluated on a group at once
+        """
+        decisions = [None] * len(candidates)
+        pending = {}  # extension: the indexes of the candidates to decide
+        for index, candidate in enumerate(candidates):
+            decisions[index] = self.cached_decision(candidate)
+            if decisions[index] is None:
+                pending.setdefault(candidate.extension, []).append(index)
+        for extension, indexes in pending.items():
+            group = [candidates[index] for index in indexes]
+            for index, matches in zip(indexes, self.get_matches_many(group, extension)):
+                decisions[index] = get_decision(candidates[index], matches)
+                self.cache_decision(decisions[index])
+        for decision in decisions:
+            self.count_win(decision)
+        return decisions
+
+    def cached_decision(self, candidate):
+        """ Return the decision from the cache, None when we have to decide it """
+        if self.cache:
+            cached = self.cache.get(candidate)
+            if cached is not None:
+                matches, top = cached
+                return self.decision_from_positions(candidate, matches, top)
+        return None
+
+    def decision_from_positions(self, candidate, matches, top):
+        """ The decision from the (confidence, rule position) matches and the top rule positions """
+        return Decision(candidate,
+                        [(confidence, self.rules[position]) for confidence, position in matches],
+                        top=[self.rules[position] for position in top])
+
+    def cache_decision(self, decision):
+        if self.cache:
+            positions = self.positions
+            self.cache.put(decision.candidate,
+                           [(confidence, positions[id(rule)])
+                            for confidence, rule in decision.matches],
+                           [positions[id(rule)] for rule in decision.top])
+
+    def decide(self, candidate):
+        return get_decision(candidate, self.get_matches(candidate, prune=True))
+
+
+def get_decision(candidate, matches):
+    """ The decision from the matches: the rules with the max confidence are the top ones """
+    if not matches:
+        return Decision(candidate, matches, top=[])
+    # group by confidence
+    rules_by_confidence = {0: []}
+    max_confidence = 0
+    for confidence, rule in matches:
+        rules = rules_by_confidence.get(confidence, [])
+        rules.append(rule)
+        rules_by_confidence[confidence] = rules
+        if confidence > max_confidence:
+            max_confidence = confidence
+    return Decision(candidate, matches, top=rules_by_confidence[max_confidence])
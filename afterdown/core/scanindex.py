@@ -0,0 +1,98 @@
+from __future__ import unicode_literals
+
+import os
+import stat
+
+from afterdown.core.candidate import Candidate
+from afterdown.core.jsonstore import JsonStore
+from afterdown.core.walker import scan_folder, walk_folders
+
+
+def file_signature(st):
+    """ What tells us that a file changed """
+    return [st.st_size, st.st_mtime, st.st_ino]
+
+
+class ScanIndex(JsonStore):
+    """ A persistent index of the source folder, to avoid walking and classifying again
+        what didn't change since the previous run.
+
+        For each folder we keep its mtime, its subfolders and its files with their
+        signature (size, mtime, inode) and the outcome of their last classification.
+        A folder with the same mtime is not listed again (its files are just checked),
+        a file with the same signature is not classified again: its previous outcome is replayed.
+        The whole index is discarded when the rules fingerprint changes.
+    """
+    description = "scan index"
+    stamp_key = "fingerprint"
+    entries_key = "folders"
+
+    def __init__(self, filepath, fingerprint):
+        super(ScanIndex, self).__init__(filepath, stamp=fingerprint)
+
+    def list_folder(self, root, folder):
+        """ Return the subfolders and the files of a folder (relative to root)
+            the files are tuples (name, stat, outcome)
+            outcome is the one of the previous run, None when the file changed or is new
+        """
+        known = self.data.get(folder, {})
+        fullfolder = os.path.join(root, folder)
+        folder_mtime = os.stat(fullfolder).st_mtime
+        known_files = known.get('files', {})
+        stats = []
+        if known and known['mtime'] == folder_mtime:
+            # nothing was added or removed, no need to list it again
+            subfolders = list(known['dirs'])
+            for name in sorted(known_files):
+                try:
+                    st = os.stat(os.path.join(fullfolder, name))  # follow links as the walker
+                except OSError:
+                    continue  # broken link or removed meanwhile
+                if stat.S_ISDIR(st.st_mode):
+                    subfolders.append(name)
+                else:
+                    stats.append((name, st))
+        else:
+            folder_entries, file_entries = scan_folder(fullfolder)
+            subfolders = [entry.name for entry in folder_entries]
+            for entry in file_entries:
+                try:
+                    stats.append((entry.name, entry.stat()))
+                except OSError:
+                    continue
+        files = []
+        for name, st in stats:
+            # files can still change in place (ex. while downloading), check their signature
+            previous = known_files.get(name)
+            if previous and previous[:3] == file_signature(st):
+                outcome = previous[3]
+            else:
+                outcome = None
+            files.append((name, st, outcome))
+        # all files are indexed, the ones left unclassified will be classified next time
+        self.newdata[folder] = dict(
+            mtime=folder_mtime,
+            dirs=subfolders,
+            files={name: file_signature(st) + [None] for name, st, outcome in files},
+        )
+        return subfolders, files
+
+    def walk(self, root, workers=1):
+        """ Walk the root folder top-down, yielding the candidates found
+            each candidate has its stat and its previous outcome (None to classify it)
+        """
+        list_folder = lambda folder: self.list_folder(root, folder)
+        for folder, files in walk_folders(list_folder, workers=workers):
+            for name, st, outcome in files:
+                filepath = os.path.join(folder, name)
+                yield Candidate(
+                    filepath=filepath,
+                    fullpath=os.path.join(root, filepath),
+                    stat=st,
+                    outcome=outcome,
+                )
+
+    def record(self, candidate, outcome):
+        """ Remember the outcome of a file that stays in the source after this run """
+        folder, name = os.path.split(candidate.filepath)
+        self.newdata[folder]['files'][name] = file_signature(candidate.stat) + [outcome]
@@ -7,6 +7,7 @@ RE_GET_SEASON_N_EPISODE2 = re.compile(r'S(\d+)\sEp(\d+)', re.IGNORECASE | re.VER
 RE_INITIAL_EPISODE = re.compile(r'^(\d+)\W', re.IGNORECASE | re.VERBOSE)  # 12- is clear
 RE_EPISODE = re.compile(r'^(?:episode|ep|e)[\s\.]*(\d+)\W', re.IGNORECASE | re.VERBOSE)  # Ep 1
 RE_THREE_NUMBERS = re.compile(r'(\d)(?:[ExX]|)(\d{2,})', re.IGNORECASE | re.VERBOSE)  # xExx or Xxx
+RE_SEASON_X_EPISODE = re.compile(r'(?:^|[\W_])\d{1,2}x\d{2}(?:$|[\W_])', re.IGNORECASE)  # 1x03
 
 
 def get_episode_infos(filepath):
@@ -27,3 +28,15 @@ def get_episode_infos(filepath):
                 results = (None, match.group(1))  # just the episode name
             return tuple(map(lambda x: x and x.zfill(2) or x, results))
     return None, None
+
+
+def quick_video_type(filepath):
+    """ Return serie when the filename has a season and episode (S01E02 or 1x02),
+        None when it needs guessit: a year alone doesn't tell a movie
+        (ex. True.Detective.2014.01of08 or Twin.Peaks.1990.Pilot are episodes)
+    """
+    filename = os.path.basename(filepath)
+    if RE_GET_SEASON_N_EPISODE.search(filename) or RE_GET_SEASON_N_EPISODE2.search(filename) \
+        or RE_SEASON_X_EPISODE.search(filename):
+        return "serie"
+    return None
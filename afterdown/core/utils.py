@@ -1,6 +1,10 @@
-import collections
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
-from guessit import guessit
+from afterdown.core.guessitcache import guessit_parse
+from afterdown.core.season_info import quick_video_type
 
 
 def recursive_update(source_dict, updates):
@@ -8,7 +12,7 @@ def recursive_update(source_dict, updates):
         thanks to the almighty Alex Martelli: http://stackoverflow.com/a/3233356/22136
     """
     for k, v in updates.items():
-        if isinstance(v, collections.Mapping):
+        if isinstance(v, Mapping):
             r = recursive_update(source_dict.get(k, {}), v)
             source_dict[k] = r
         else:
@@ -21,18 +25,67 @@ def guessit_video_type(filename):
         All the hard work is done by the guessit library,
         we wrap it just to smooth some corner case
      """
-    g = guessit(filename)
-    if g.get('type') == 'episode':
+    g = guessit_parse(filename)
+    if g['type'] == 'episode':
         return 'serie'
-    if 'part' in g:
+    if g['part']:
         return "serie"
-    return g.get('type') or "unknown"
+    return g['type'] or "unknown"
+
+
+class VideoTypeStats(object):
+    """ How many video types were settled by the quick regexes and how many by guessit
+        when check, the quick types are compared with guessit (to tune the regexes)
+    """
+
+    def __init__(self, check=False):
+        self.check = check
+        self.quick = 0
+        self.guessit = 0
+        self.agreed = 0
+        self.disagreed = []  # the (filename, quick type, guessit type) that differ
+
+    def __str__(self):
+        summary = "Video types: %d by filename, %d by guessit" % (self.quick, self.guessit)
+        if self.check and self.quick:
+            summary += ". The filename agreed with guessit on %d of %d (%.1f%%)" % (
+                self.agreed, self.quick, 100.0 * self.agreed / self.quick)
+        return summary
+
+    def merge(self, other):
+        """ Add the stats of another process """
+        self.quick += other.quick
+        self.guessit += other.guessit
+        self.agreed += other.agreed
+        self.disagreed.extend(other.disagreed)
+
+
+video_type_stats = VideoTypeStats()
+
+
+def video_type(filename):
+    """ The movie or serie type of a filename: from the season and year marks when obvious,
+        otherwise from guessit
+    """
+    stats = video_type_stats
+    quick_type = quick_video_type(filename)
+    if quick_type is None:
+        stats.guessit += 1
+        return guessit_video_type(filename)
+    stats.quick += 1
+    if stats.check:
+        guessed_type = guessit_video_type(filename)
+        if guessed_type == quick_type:
+            stats.agreed += 1
+        else:
+            stats.disagreed.append((filename, quick_type, guessed_type))
+    return quick_type
 
 
 def guessit_video_title(filename):
     """ Get the movie/serie title, from guessit, case normalized """
-    g = guessit(filename)
-    return g.get('title', '').title()
+    g = guessit_parse(filename)
+    return g['title'].title()
 
 
 class CircularDependencyException(Exception):
@@ -0,0 +1,95 @@
+from __future__ import unicode_literals
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from afterdown.core.candidate import Candidate
+
+logger = logging.getLogger("afterdown.walker")
+
+LIST_AHEAD = 4  # the folders each worker can list before the walk gets to them
+
+
+def scan_folder(fullfolder, followlinks=True):
+    """ List a folder with os.scandir, returning the DirEntry of its subfolders and files
+        both sorted by name. Telling folders from files doesn't need a stat on most filesystems
+    """
+    subfolders, files = [], []
+    for entry in os.scandir(fullfolder):
+        try:
+            is_dir = entry.is_dir(follow_symlinks=followlinks)
+        except OSError:
+            is_dir = False
+        if is_dir:
+            subfolders.append(entry)
+        else:
+            files.append(entry)
+    subfolders.sort(key=lambda entry: entry.name)
+    files.sort(key=lambda entry: entry.name)
+    return subfolders, files
+
+
+def walk_folders(list_folder, workers=1):
+    """ Visit the folders top-down, yielding (folder, files) in order:
+        list_folder(folder) returns the sorted subfolder names and the files of a folder.
+        With more workers, the next folders to visit are listed ahead in a thread pool
+        (when the listing waits for the disk or the network) but yielded in the same order.
+        At most LIST_AHEAD folders for each worker are listed before we get to them
+    """
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    ahead = LIST_AHEAD * workers
+    listings = {}  # folder: the future of its listing
+    folders = [""]  # the folders to visit, the next one is the last
+    try:
+        while folders:
+            if executor:
+                for folder in reversed(folders):
+                    if len(listings) >= ahead:
+                        break
+                    if folder not in listings:
+                        listings[folder] = executor.submit(list_folder, folder)
+            folder = folders.pop()
+            logger.debug(folder or "/")
+            try:
+                if folder in listings:
+                    subfolders, files = listings.pop(folder).result()
+                else:
+                    subfolders, files = list_folder(folder)
+            except OSError as e:
+                logger.error("Cannot list folder %s. %s" % (folder, e))
+                continue
+            yield folder, files
+            # visit the subfolders in order
+            folders.extend(os.path.join(folder, name) for name in reversed(subfolders))
+    finally:
+        if executor:
+            for future in listings.values():
+                future.cancel()
+            executor.shutdown(wait=False)
+
+
+def walk_source(root, followlinks=True, workers=1):
+    """ Walk the root folder top-down, lazily yielding a candidate for each file
+        the candidate keeps its DirEntry, so its stat is done once and only when needed
+    """
+
+    def list_folder(folder):
+        subfolders, files = scan_folder(os.path.join(root, folder), followlinks=followlinks)
+        return [entry.name for entry in subfolders], files
+
+    for folder, files in walk_folders(list_folder, workers=workers):
+        for entry in files:
+            yield Candidate(
+                filepath=os.path.join(folder, entry.name),  # with a path relative to the source
+                fullpath=entry.path,  # the fullpath, needed if the rule wants to access the file
+                entry=entry,
+            )
+
+
+def walk_key(filepath):
+    """ A sort key giving the order the walk meets the files:
+        the files of a folder come before its subfolders, both sorted by name
+    """
+    parts = filepath.split(os.path.sep)
+    return [(1, name) for name in parts[:-1]] + [(0, parts[-1])]
@@ -0,0 +1,169 @@
+from __future__ import unicode_literals
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+from afterdown.core.walker import walk_source, scan_folder
+
+logger = logging.getLogger("afterdown.watch")
+
+DEFAULT_DEBOUNCE = 10  # seconds a file should be left alone before we consider it complete
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len (of the name that follows)
+
+
+class Inotify(object):
+    """ A minimal Linux inotify binding, done with ctypes to avoid further dependencies """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available on this system")
+        self.libc = libc
+        self.fd = self.check(libc.inotify_init1(IN_CLOEXEC))
+
+    @staticmethod
+    def check(result):
+        if result < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return result
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        return self.check(self.libc.inotify_add_watch(self.fd, os.fsencode(path),
+                                                      mask | IN_ONLYDIR))
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)  # it can be already gone, ignore errors
+
+    def read_events(self, timeout=None):
+        """ Wait at most timeout seconds for events, return a list of (wd, mask, name) """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SourceWatcher(object):
+    """ Watch recursively the source folder for files created, changed or moved in.
+        The files are returned when nobody touched them for the debounce time,
+        so files still being written are not processed.
+    """
+
+    def __init__(self, root, debounce=DEFAULT_DEBOUNCE):
+        self.root = root
+        self.debounce = debounce
+        self.inotify = Inotify()
+        self.folders = {}  # watch descriptor: folder relative to root
+        self.pending = {}  # filepath relative to root: time of the last event
+        self.watch_folder("")
+
+    def watch_folder(self, folder, scan=False):
+        """ Watch a folder and its subfolders,
+            when scan the files already there are pending (they arrived before the watch)
+        """
+        fullfolder = os.path.join(self.root, folder)
+        try:
+            wd = self.inotify.add_watch(fullfolder)
+        except OSError as e:
+            logger.error("Cannot watch folder %s. %s" % (fullfolder, e))
+            return
+        self.folders[wd] = folder
+        try:
+            subfolders, files = scan_folder(fullfolder)
+        except OSError:
+            return
+        if scan:
+            now = time.time()
+            for entry in files:
+                self.pending[os.path.join(folder, entry.name)] = now
+        for entry in subfolders:
+            self.watch_folder(os.path.join(folder, entry.name), scan=scan)
+
+    def unwatch_folder(self, folder):
+        """ A folder left the source, forget it and its subfolders """
+        for wd, watched in list(self.folders.items()):
+            if watched == folder or watched.startswith(folder + os.path.sep):
+                self.inotify.rm_watch(wd)
+                del self.folders[wd]
+        for filepath in list(self.pending):
+            if filepath.startswith(folder + os.path.sep):
+                del self.pending[filepath]
+
+    def handle_event(self, wd, mask, name, now):
+        if mask & IN_Q_OVERFLOW:
+            logger.warning("Too many changes in the source, some events are lost: rescanning")
+            for candidate in walk_source(self.root):
+                self.pending[candidate.filepath] = now
+            return
+        if mask & IN_IGNORED:
+            self.folders.pop(wd, None)  # the watched folder is gone
+            return
+        folder = self.folders.get(wd)
+        if folder is None or not name:
+            return
+        filepath = os.path.join(folder, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self.watch_folder(filepath, scan=True)
+            elif mask & IN_MOVED_FROM:
+                self.unwatch_folder(filepath)
+        elif mask & (IN_DELETE | IN_MOVED_FROM):
+            self.pending.pop(filepath, None)
+        else:
+            self.pending[filepath] = now  # created or still being written
+
+    def wait(self):
+        """ Block until some files are quiet, then return their sorted filepaths """
+        while True:
+            now = time.time()
+            quiet = sorted(filepath for filepath, last_event in self.pending.items()
+                           if now - last_event >= self.debounce)
+            if quiet:
+                for filepath in quiet:
+                    del self.pending[filepath]
+                return quiet
+            if self.pending:
+                timeout = min(self.pending.values()) + self.debounce - now
+            else:
+                timeout = None  # nothing to do, wait for the next event
+            for wd, mask, name in self.inotify.read_events(timeout):
+                self.handle_event(wd, mask, name, time.time())
+
+    def __iter__(self):
+        while True:
+            yield self.wait()
+
+    def close(self):
+        self.inotify.close()
@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+from afterdown.__main__ import AfterDown
+
+
+@pytest.fixture
+def get_sorter(tmpdir):
+    """ Return a function creating a sorter on a source with an unknown, a skipped
+        and a moved file: its keyword arguments change the configuration (rules included)
+    """
+    source = tmpdir.mkdir("source")
+    source.mkdir("folder").join("unknown.txt").write("?")
+    source.join("keep.me").write("keep")
+    source.join("movie.avi").write("movie")
+
+    def get_sorter(**config):
+        config_file = tmpdir.join("rules.json")
+        config_file.write(json.dumps(dict(dict(
+            source=str(source),
+            target=str(tmpdir.join("target")),
+            knownfiles=str(tmpdir.join(".afterknown")),
+            rules=[
+                dict(match="keep", action="skip"),
+                dict(extension="avi", to="Movies"),
+            ],
+        ), **config)))
+        return AfterDown(config_file=str(config_file))
+
+    return get_sorter
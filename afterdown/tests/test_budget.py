@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from afterdown.core.walker import walk_key, walk_source
+
+
+@pytest.fixture
+def budget_sorter(get_sorter, tmpdir):
+    """ As get_sorter, keeping the cursor of the walk """
+    return lambda **config: get_sorter(cursorfile=str(tmpdir.join(".aftercursor")), **config)
+
+
+def test_walk_key(tmpdir):
+    source = tmpdir.mkdir("source")
+    source.mkdir("b").join("a.txt").write("")
+    source.mkdir("a").mkdir("b").join("a.txt").write("")
+    source.join("a", "z.txt").write("")
+    source.join("z.txt").write("")
+    filepaths = [candidate.filepath for candidate in walk_source(str(source))]
+    assert filepaths == sorted(filepaths, key=walk_key)
+    assert filepaths[0] == "z.txt"
+
+
+def test_max_files_resume(budget_sorter, tmpdir):
+    sorter = budget_sorter(maxFiles=2)
+    sorter.run()
+    assert sorter.counters['_tot'] == 2
+    assert tmpdir.join(".aftercursor").read() == "movie.avi"
+
+    resorter = budget_sorter(maxFiles=2)
+    resorter.run()
+    assert resorter.counters['_tot'] == 1, "The run should continue after the cursor"
+    assert resorter.counters['_unknown_new'] == 1
+    assert os.listdir(str(tmpdir.join("target", "Movies"))) == ["movie.avi"]
+    assert not tmpdir.join(".aftercursor").check(), "The walk got to the end"
+
+
+def test_max_seconds(budget_sorter):
+    sorter = budget_sorter(maxSeconds=0.000001)
+    sorter.run()
+    assert sorter.counters['_tot'] == 0
+
+
+def test_size_order(budget_sorter, tmpdir):
+    tmpdir.join("source", "folder", "c.avi").write("c" * 100)
+    budget_sorter(maxFiles=1, budgetOrder="size").run()
+    assert os.listdir(str(tmpdir.join("target", "Movies"))) == ["c.avi"]
+    assert json.loads(tmpdir.join(".aftercursor").read()) == [-100, os.path.join("folder", "c.avi")]
+
+
+def test_size_order_resume(budget_sorter, tmpdir):
+    """ A big file staying in the source doesn't stop the others """
+    tmpdir.join("source", "big.iso").write("x" * 1000)
+    for run in range(2):
+        budget_sorter(maxFiles=1, budgetOrder="size").run()
+    # big.iso then movie.avi: a file each run
+    assert tmpdir.join("source", "big.iso").check(), "Unknown, it stays"
+    assert os.listdir(str(tmpdir.join("target", "Movies"))) == ["movie.avi"]
@@ -0,0 +1,34 @@
+import json
+
+from afterdown.core import guessitcache, utils
+
+
+def test_classify_workers(get_sorter, tmpdir):
+    sorter = get_sorter(classifyWorkers=2, batchSize=2)
+    sorter.run()
+    assert sorter.classifier is None, "The pool is closed at the end of the run"
+    assert sorter.counters['_tot'] == 3
+    assert sorter.counters['_unknown_new'] == 1
+    assert sorter.counters['SKIP'] == 1
+    assert sorter.counters['MOVE'] == 1
+    assert tmpdir.join("target", "Movies", "movie.avi").check()
+
+
+def test_workers_guessit_store(get_sorter, tmpdir):
+    """ The parses and the video types stats of the workers come back to the main process """
+    source = tmpdir.join("source")
+    source.join("Treme.1x03.Right.Place.avi").write("serie")
+    store_file = tmpdir.join(".afterguessit")
+    sorter = get_sorter(rules=[dict(extension="avi", foundType="serie", to="Series")],
+                        classifyWorkers=2, batchSize=2, guessitcache=str(store_file),
+                        checkVideoTypes=True)
+    try:
+        sorter.run()
+    finally:
+        guessitcache.set_store(None)
+    assert sorter.counters['MOVE'] == 1
+    assert tmpdir.join("target", "Series", "Treme.1x03.Right.Place.avi").check()
+    parses = json.loads(store_file.read())['parses']
+    assert sorted(parses) == ["Treme.1x03.Right.Place.avi", "movie.avi"]
+    stats = utils.video_type_stats
+    assert (stats.quick, stats.guessit, stats.agreed) == (1, 1, 1)
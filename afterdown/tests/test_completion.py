@@ -0,0 +1,89 @@
+import json
+import os
+import time
+
+from afterdown.__main__ import AfterDown
+from afterdown.core.candidate import Candidate
+from afterdown.core.completion import CompletionChecker, open_for_writing
+
+
+def get_candidates(source, *filepaths):
+    return [Candidate(filepath=filepath, fullpath=str(source.join(filepath)))
+            for filepath in filepaths]
+
+
+def test_old_files_are_complete(tmpdir):
+    source = tmpdir.mkdir("source")
+    source.join("old.avi").write("old")
+    os.utime(str(source.join("old.avi")), (0, 0))
+    checker = CompletionChecker(str(tmpdir.join(".afterdeferred")), window=60)
+    start = time.time()
+    complete = list(checker.complete(str(source), get_candidates(source, "old.avi")))
+    assert [candidate.filepath for candidate in complete] == ["old.avi"]
+    assert time.time() - start < 1, "Files older than the window don't need to wait"
+
+
+def test_recent_file_is_deferred(tmpdir):
+    source = tmpdir.mkdir("source")
+    growing = source.join("growing.avi")
+    growing.write("part")
+    source.join("stable.avi").write("done")
+    os.utime(str(source.join("stable.avi")), (0, 0))
+    deferred_file = tmpdir.join(".afterdeferred")
+
+    def run():
+        checker = CompletionChecker(str(deferred_file), window=60)
+        start = time.time()
+        complete = [candidate.filepath
+                    for candidate in checker.complete(str(source),
+                                                      get_candidates(source, "growing.avi",
+                                                                     "stable.avi"))]
+        assert time.time() - start < 1, "The run doesn't wait for the files being written"
+        checker.save()
+        return complete, checker
+
+    complete, checker = run()
+    assert complete == ["stable.avi"]
+    assert list(checker.deferred) == ["growing.avi"]
+
+    # a download keeping the original mtime: only its size tells it's still growing
+    growing.write("part and more")
+    os.utime(str(growing), (0, 0))
+    complete, checker = run()
+    assert complete == ["stable.avi"], "It changed since the previous run"
+    complete, checker = run()
+    assert complete == ["growing.avi", "stable.avi"], "Unchanged since the previous run"
+    assert checker.deferred == {}
+    assert json.loads(deferred_file.read())["files"] == {}
+
+
+def test_deferred_with_scan_index(tmpdir):
+    """ The files deferred in a subfolder are met again by the indexed walk """
+    source = tmpdir.mkdir("source")
+    source.mkdir("sub").join("a.xyz").write("a")
+    os.utime(str(source.join("sub", "a.xyz")), (0, 0))
+    tmpdir.join(".afterdeferred").write(json.dumps(dict(version=1, files={"sub/a.xyz": [1, 0]})))
+    config_file = tmpdir.join("rules.json")
+    config_file.write(json.dumps(dict(
+        source=str(source),
+        target=str(tmpdir.join("target")),
+        knownfiles=str(tmpdir.join(".afterknown")),
+        scanindex=str(tmpdir.join(".afterscan")),
+        deferredfiles=str(tmpdir.join(".afterdeferred")),
+        completionWindow=60,
+        rules=[dict(extension="avi", to="Movies")],
+    )))
+    sorter = AfterDown(config_file=str(config_file))
+    sorter.run()
+    assert sorter.counters['_tot'] == 1
+    assert sorter.counters['_unknown_new'] == 1
+    assert json.loads(tmpdir.join(".afterdeferred").read())["files"] == {}
+
+
+def test_open_for_writing(tmpdir):
+    source = tmpdir.mkdir("source")
+    source.join("done.avi").write("done")
+    with open(str(source.join("writing.avi")), "w"):
+        writing = open_for_writing(str(source))
+    assert str(source.join("writing.avi")) in writing
+    assert str(source.join("done.avi")) not in writing
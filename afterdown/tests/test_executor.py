@@ -0,0 +1,80 @@
+import json
+import threading
+import time
+
+from afterdown.__main__ import AfterDown
+from afterdown.core.candidate import Candidate
+from afterdown.core.executor import ActionExecutor
+
+
+class SlowRule(object):
+    """ A rule counting how many times it's applied concurrently """
+    to = None
+    config = None
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def apply(self, candidate, commit=True, target_lock=None):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return candidate.filepath
+
+
+def test_device_limit(tmpdir):
+    tmpdir.join("file").write("")
+    candidates = [Candidate("file", fullpath=str(tmpdir.join("file"))) for i in range(6)]
+    for device_workers in (1, 2):
+        rule = SlowRule()
+        executor = ActionExecutor(workers=4, device_workers=device_workers)
+        futures = [executor.submit(rule, candidate) for candidate in candidates]
+        assert [future.result() for future in futures] == ["file"] * 6
+        executor.shutdown()
+        assert rule.max_running == device_workers, "All the files are on the same device"
+
+
+
+def test_busy_device_doesnt_block_others(tmpdir, monkeypatch):
+    """ The operations waiting for a busy device don't take the threads of the other devices """
+    tmpdir.join("file").write("")
+    candidate = Candidate("file", fullpath=str(tmpdir.join("file")))
+    slow, fast = SlowRule(), SlowRule()
+    slow.device, fast.device = "A", "B"
+    executor = ActionExecutor(workers=3, device_workers=1)
+    monkeypatch.setattr(executor, "get_device", lambda rule, candidate: rule.device)
+    start = time.time()
+    slow_futures = [executor.submit(slow, candidate) for i in range(5)]
+    fast_future = executor.submit(fast, candidate)
+    fast_future.result()
+    assert time.time() - start < 0.2, "The move to device B shouldn't wait for device A"
+    assert [future.result() for future in slow_futures] == ["file"] * 5
+    executor.shutdown()
+    assert slow.max_running == 1
+
+
+def test_parallel_apply(tmpdir):
+    source = tmpdir.mkdir("source")
+    for folder in range(4):
+        for episode in range(5):
+            source.ensure("pack%d" % folder, "episode%d.avi" % episode).write("")
+    config_file = tmpdir.join("rules.json")
+    config_file.write(json.dumps(dict(
+        source=str(source),
+        target=str(tmpdir.join("target")),
+        knownfiles=str(tmpdir.join(".afterknown")),
+        applyWorkers=4,
+        deviceWorkers=4,
+        rules=[dict(extension="avi", to="Videos", overwrite="rename")],
+    )))
+    sorter = AfterDown(config_file=str(config_file))
+    sorter.run()
+    assert sorter.counters['MOVE'] == 20
+    assert len(tmpdir.join("target", "Videos").listdir()) == 20, \
+        "Files with the same name should be renamed, not overwritten"
+    assert source.listdir() == [], "The emptied folders are removed"
@@ -0,0 +1,203 @@
+import errno
+import json
+import os
+
+import pytest
+
+from afterdown.__main__ import AfterDown
+from afterdown.core import fileops
+from afterdown.core.fileops import move_file, copy_file, link_file, reflink_file, \
+    already_placed, PART_SUFFIX, PART_SOURCE_SUFFIX
+
+
+def test_move_same_device(tmpdir):
+    source = tmpdir.join("movie.avi")
+    source.write("movie")
+    inode = source.stat().ino
+    target = tmpdir.mkdir("target").join("movie.avi")
+    move_file(str(source), str(target))
+    assert not source.check()
+    assert target.stat().ino == inode, "On the same device the file should be renamed"
+
+
+def test_move_other_device(tmpdir, monkeypatch):
+    monkeypatch.setattr(fileops, "same_device", lambda source, target_folder: False)
+    source = tmpdir.join("movie.avi")
+    source.write_binary(os.urandom(100000))
+    content = source.read_binary()
+    target = tmpdir.mkdir("target").join("movie.avi")
+    move_file(str(source), str(target), verify=True)
+    assert not source.check()
+    assert target.read_binary() == content
+    assert not tmpdir.join("target", "movie.avi" + PART_SUFFIX).check()
+
+
+def interrupted_copy(source, target, monkeypatch, chunks):
+    """ Start copying source to target, stopping after some chunks """
+    copied = []
+    kernel_copy = fileops.kernel_copy
+
+    def failing_copy(*args):
+        if len(copied) == chunks:
+            raise IOError(errno.EIO, "Interrupted")
+        copied.append(args[2])
+        return kernel_copy(*args)
+
+    monkeypatch.setattr(fileops, "kernel_copy", failing_copy)
+    with pytest.raises(IOError):
+        copy_file(source, target)
+    monkeypatch.setattr(fileops, "kernel_copy", kernel_copy)
+
+
+def test_resume_copy(tmpdir, monkeypatch):
+    monkeypatch.setattr(fileops, "CHUNK_SIZE", 1000)
+    source = tmpdir.join("movie.avi")
+    source.write_binary(os.urandom(10000))
+    content = source.read_binary()
+    target = tmpdir.join("copy.avi")
+    part = tmpdir.join("copy.avi" + PART_SUFFIX)
+    interrupted_copy(str(source), str(target), monkeypatch, chunks=4)
+    assert part.size() == 4000
+
+    copied = []
+    kernel_copy = fileops.kernel_copy
+    monkeypatch.setattr(fileops, "kernel_copy",
+                        lambda *args: copied.append(args[2]) or kernel_copy(*args))
+    copy_file(str(source), str(target), verify=True)
+    assert copied[0] == 4000, "The copy should restart from the partial file"
+    assert target.read_binary() == content
+    assert not part.check()
+    assert not tmpdir.join("copy.avi" + PART_SOURCE_SUFFIX).check()
+
+
+def test_restart_stale_copy(tmpdir):
+    target = tmpdir.join("copy.avi")
+    part = tmpdir.join("copy.avi" + PART_SUFFIX)
+    part.write_binary(b"x" * 100)
+    os.utime(str(part), (0, 0))  # a partial copy older than the source
+    source = tmpdir.join("movie.avi")
+    source.write_binary(b"y" * 1000)
+    copy_file(str(source), str(target))
+    assert target.read_binary() == b"y" * 1000
+
+
+def test_restart_copy_of_another_source(tmpdir, monkeypatch):
+    """ A partial copy of another file with the same name is not resumed """
+    monkeypatch.setattr(fileops, "CHUNK_SIZE", 100)
+    target = tmpdir.join("copy.avi")
+    source = tmpdir.mkdir("first").join("movie.avi")
+    source.write_binary(b"x" * 1000)
+    interrupted_copy(str(source), str(target), monkeypatch, chunks=2)
+    # a new download of the same name, bigger and older than the partial copy
+    source = tmpdir.mkdir("second").join("movie.avi")
+    source.write_binary(b"y" * 2000)
+    os.utime(str(source), (0, 0))
+    copy_file(str(source), str(target))
+    assert target.read_binary() == b"y" * 2000
+
+
+def test_verify_failure(tmpdir, monkeypatch):
+    source = tmpdir.join("movie.avi")
+    source.write("movie")
+    checksums = iter(["a", "b"])
+    monkeypatch.setattr(fileops, "file_checksum", lambda path: next(checksums))
+    with pytest.raises(IOError):
+        copy_file(str(source), str(tmpdir.join("copy.avi")), verify=True)
+    assert not tmpdir.join("copy.avi").check()
+    assert not tmpdir.join("copy.avi" + PART_SUFFIX).check()
+    assert not tmpdir.join("copy.avi" + PART_SOURCE_SUFFIX).check()
+
+
+def test_link(tmpdir):
+    source = tmpdir.join("movie.avi")
+    source.write("movie")
+    target = tmpdir.mkdir("target").join("movie.avi")
+    link_file(str(source), str(target))
+    assert source.check(), "The source should be left there for seeding"
+    assert target.stat().ino == source.stat().ino
+    assert already_placed(str(source), str(target))
+
+
+def test_link_other_device(tmpdir, monkeypatch):
+    def no_link(source, target):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", no_link)
+    source = tmpdir.join("movie.avi")
+    source.write("movie")
+    target = tmpdir.join("copy.avi")
+    link_file(str(source), str(target))
+    assert target.read() == "movie"
+    assert already_placed(str(source), str(target)), "The copy keeps the source mtime"
+
+
+def test_reflink(tmpdir):
+    # on filesystems without reflinks (ext4, tmpfs) the file is copied
+    source = tmpdir.join("movie.avi")
+    source.write_binary(os.urandom(10000))
+    target = tmpdir.join("clone.avi")
+    reflink_file(str(source), str(target))
+    assert source.check()
+    assert target.read_binary() == source.read_binary()
+    assert not tmpdir.join("clone.avi" + PART_SUFFIX).check()
+
+
+def link_sorter(tmpdir, **rule):
+    source = tmpdir.ensure("source", dir=True)
+    config_file = tmpdir.join("rules.json")
+    config_file.write(json.dumps(dict(
+        source=str(source),
+        target=str(tmpdir.join("target")),
+        knownfiles=str(tmpdir.join(".afterknown")),
+        scanindex=str(tmpdir.join(".afterscan")),
+        rules=[dict(extension="avi", to="Movies", action="link", **rule)],
+    )))
+    return AfterDown(config_file=str(config_file))
+
+
+def test_link_action(tmpdir):
+    source = tmpdir.mkdir("source")
+    source.join("movie.avi").write("movie")
+    sorter = link_sorter(tmpdir)
+    sorter.run()
+    assert sorter.counters['LINK'] == 1
+    assert source.join("movie.avi").check(), "A linked file stays in the source"
+    target = tmpdir.join("target", "Movies", "movie.avi")
+    assert target.read() == "movie"
+
+    resorter = link_sorter(tmpdir)
+    resorter.run()
+    assert resorter.counters['SKIP'] == 1, "The file is already linked"
+    assert tmpdir.join("target", "Movies").listdir() == [target], "Not renamed as a collision"
+
+    target.remove()  # the library copy is deleted, the next run links it again
+    resorter = link_sorter(tmpdir)
+    resorter.run()
+    assert resorter.counters['LINK'] == 1
+    assert target.read() == "movie"
+
+
+def test_link_overwrite(tmpdir):
+    source = tmpdir.mkdir("source")
+    source.join("movie.avi").write("new movie")
+    target = tmpdir.ensure("target", "Movies", "movie.avi")
+    target.write("old movie")
+    sorter = link_sorter(tmpdir, overwrite="overwrite")
+    sorter.run()
+    assert sorter.counters['LINK'] == 1
+    assert target.read() == "new movie"
+    assert target.stat().ino == source.join("movie.avi").stat().ino
+
+
+def test_link_failure(tmpdir, monkeypatch):
+    from afterdown.core import rules
+
+    def failing_link(source, target):
+        raise OSError(errno.EACCES, "Permission denied")
+
+    monkeypatch.setattr(rules, "link_file", failing_link)
+    tmpdir.mkdir("source").join("movie.avi").write("movie")
+    sorter = link_sorter(tmpdir)
+    sorter.run()
+    assert sorter.counters['LINK'] == 0, "A failed link is not reported as done"
+    assert sorter.counters['_failed'] == 1
@@ -23,3 +23,29 @@ def test_guessit_serie():
 
 def test_guessit_film():
     expecting_guess(FILM_EXAMPLES, 'movie')
+
+
+def test_guessit_cache(tmpdir, monkeypatch):
+    from afterdown.core import guessitcache
+    parsed = []
+    guessit = guessitcache.guessit
+    monkeypatch.setattr(guessitcache, "guessit", lambda filename: parsed.append(filename) or
+                                                                  guessit(filename))
+    store_file = str(tmpdir.join(".afterguessit"))
+    filename = SERIE_EXAMPLES[0]
+    guessitcache.set_store(guessitcache.GuessitStore(store_file))
+    try:
+        assert guessit_video_type(filename) == "serie"
+        assert guessit_video_title(filename) == "Treme"
+        assert parsed == [filename], "The parse should be shared by the helpers"
+        guessitcache.store.save()
+
+        guessitcache.set_store(guessitcache.GuessitStore(store_file))
+        assert guessit_video_type(filename) == "serie"
+        assert parsed == [filename], "The parse should come from the store"
+
+        guessitcache.set_store(guessitcache.GuessitStore(store_file, version="another"))
+        assert guessit_video_type(filename) == "serie"
+        assert parsed == [filename, filename], "Another guessit version parses again"
+    finally:
+        guessitcache.set_store(None)
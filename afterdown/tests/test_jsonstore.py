@@ -0,0 +1,34 @@
+from afterdown.core.jsonstore import JsonStore
+
+
+def test_json_store(tmpdir):
+    filepath = str(tmpdir.join(".afterstore"))
+    store = JsonStore(filepath, stamp="v1")
+    store.newdata.update(a=1, b=2)
+    store.save()
+
+    store = JsonStore(filepath, stamp="v1")
+    assert store.data == dict(a=1, b=2)
+    store.newdata["a"] = 1
+    store.save(forget=False)
+    assert JsonStore(filepath, stamp="v1").data == dict(a=1, b=2), "Not forgetting keeps b"
+
+    store = JsonStore(filepath, stamp="v1")
+    store.newdata["a"] = 1
+    store.save()
+    assert JsonStore(filepath, stamp="v1").data == dict(a=1), "b wasn't met, it's forgotten"
+
+    assert JsonStore(filepath, stamp="v2").data == {}, "Another stamp discards the entries"
+    JsonStore(filepath, stamp="v2").save()  # not used, left as it is
+    assert JsonStore(filepath, stamp="v1").data == dict(a=1)
+
+
+def test_json_store_corrupted(tmpdir):
+    filepath = tmpdir.join(".afterstore")
+    filepath.write("{not json")
+    store = JsonStore(str(filepath), stamp="v1")
+    assert store.data == {}
+    store.newdata["a"] = 1
+    store.save()
+    assert JsonStore(str(filepath), stamp="v1").data == dict(a=1)
+    assert not tmpdir.join(".afterstore.tmp").check()
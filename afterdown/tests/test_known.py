@@ -3,10 +3,12 @@ from __future__ import print_function
 
 import os
 import shutil
+import sqlite3
 
 import pytest
 
 from afterdown.__main__ import AfterDown
+from afterdown.core.knownfiles import KnownFilesDB, open_known_files
 from afterdown.tests.playground.create_files_from_ls import LSCreator
 
 TESTS_PATH = os.path.dirname(__file__)
@@ -84,3 +86,46 @@ def test_forgot_when_missing(unknownsorter):
     resorter = getSorter()
     resorter.run()
     assert len(resorter.knownfiles.newdata) == resorter.counters.special_counters['_unknown_old']
+
+
+@pytest.mark.parametrize("filename", [".afterknown", ".afterknown.db"])
+def test_known_files_store(tmpdir, filename):
+    """ Both the text and the SQLite stores remember the asked files and forget the others """
+    filepath = str(tmpdir.join(filename))
+    known = open_known_files(filepath)
+    assert not known.is_known("a.avi")
+    assert not known.is_known("b.avi")
+    assert not known.is_known("a.avi"), "A file is known starting from the next run"
+    known.save()
+
+    known = open_known_files(filepath)
+    assert known.is_known("a.avi")
+    assert not known.is_known("c.avi")
+    known.save()  # b.avi wasn't asked, it's forgotten
+
+    known = open_known_files(filepath)
+    assert not known.is_known("b.avi")
+    known.save(forget=False)  # a partial run keeps the others
+
+    known = open_known_files(filepath)
+    assert known.is_known("a.avi") and known.is_known("b.avi") and known.is_known("c.avi")
+
+
+def test_known_files_db(tmpdir):
+    filepath = str(tmpdir.join(".afterknown.sqlite"))
+    known = open_known_files(filepath)
+    assert isinstance(known, KnownFilesDB)
+    for i in range(100):
+        known.is_known("%d.avi" % i)
+    known.save()
+
+    known = open_known_files(filepath)
+    assert known.is_known("1.avi")
+    assert not known.is_known("new.avi")
+    assert known.added == {"new.avi"}, "Only the new files are written"
+    known.save()
+
+    connection = sqlite3.connect(filepath)
+    filenames = sorted(row[0] for row in connection.execute("SELECT filename FROM known"))
+    assert filenames == ["1.avi", "new.avi"]
+    connection.close()
@@ -1,4 +1,6 @@
-from afterdown.core.matching import try_match_strings, remove_special_chars
+from afterdown.core.automaton import Automaton
+from afterdown.core.candidate import Candidate
+from afterdown.core.matching import try_match_strings, remove_special_chars, MatchEngine
 
 
 def test_remove_special_chars():
@@ -50,3 +52,36 @@ def test_match_regex():
         matches=['/\d+\ cats[\w ]+\.avi/'], max_priority=100,
     )
     assert score == 100
+
+
+def test_automaton():
+    automaton = Automaton(["he", "she", "his", "hers", ""])
+    assert automaton.search("ushers") == {"he", "she", "hers", ""}
+    assert automaton.search("history") == {"his", ""}
+
+
+def test_match_engine_as_strings():
+    matches = ['big bang theory', 'ita', '/\d+\ cats/', 's01e01', '!!!']
+    engine = MatchEngine(matches)
+    for filepath in ["Big.Bang.Theory.S01E01.ITA.avi", "44 cats.avi", "other.avi",
+                     "big bang theory/ita"]:
+        candidate = Candidate(filepath)
+        hits = engine.hits(candidate)
+        for match_string in matches:
+            assert try_match_strings(candidate, [match_string], 50, hits=hits) == \
+                   try_match_strings(candidate, [match_string], 50), match_string
+        assert try_match_strings(candidate, matches[:2], 100, hits=hits) == \
+               try_match_strings(candidate, matches[:2], 100)
+
+
+def test_combined_regexes():
+    matches = ['/^\d+ cats/', '/(do)g\\1/', '/bird/i', '/(?i)mouse/', '/fish$/g']
+    engine = MatchEngine(matches)
+    assert len(engine.combined) == 1, "The regexes without groups are combined"
+    for filepath in ["44 cats and a dodgdo.avi", "A Cat, a Bird and a Mouse", "the cats fish",
+                     "doggy dogdo"]:
+        candidate = Candidate(filepath)
+        hits = engine.hits(candidate)
+        for match_string in matches:
+            assert try_match_strings(candidate, [match_string], 100, hits=hits) == \
+                   try_match_strings(candidate, [match_string], 100), match_string
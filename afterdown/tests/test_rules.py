@@ -39,3 +39,28 @@ def test_sizes():
     assert rule.size == ("=", 1024)
     rule = Rule({"size": ">=1M"})
     assert rule.size == (">=", 1024 * 1024)
+
+
+def test_evaluation_plan(monkeypatch):
+    from afterdown.core import rules
+    from afterdown.core.candidate import Candidate
+    parsed = []
+    monkeypatch.setattr(rules, "video_type",
+                        lambda filename: parsed.append(filename) or "movie")
+    rule = Rule({"foundType": "movie", "size": ">1", "match": "film", "extension": "avi"})
+    assert [predicate.name for predicate in rule.plan][-1] == "foundType", \
+        "The guessit parse should be the last predicate"
+    assert rule.match(Candidate("a film.mkv")) is False
+    assert rule.match(Candidate("a movie.avi")) is False
+    assert parsed == [], "Guessit shouldn't parse what a cheaper predicate rejects"
+
+
+def test_plan_reorder():
+    from afterdown.core.plan import Predicate, EvaluationPlan
+    plan = EvaluationPlan([Predicate("never", lambda candidate, hits: True, cost=1),
+                           Predicate("always", lambda candidate, hits: False, cost=1)])
+    for _ in range(10):
+        assert plan.evaluate(None) is False
+    plan.reorder()
+    assert [predicate.name for predicate in plan] == ["always", "never"], \
+        "The selective predicate should be first"
@@ -0,0 +1,196 @@
+import os
+
+import pytest
+
+from afterdown.core.candidate import Candidate
+from afterdown.core.rules import Rule
+from afterdown.core.ruleset import RuleSet
+
+
+def get_ruleset():
+    config = {'types': {"video": Rule({"extensions": ["avi", "mkv"]})}}
+    return RuleSet([
+        Rule({"match": "sample", "action": "delete"}),
+        Rule({"type": "video", "to": "Movies"}, config=config),
+        Rule({"extension": "srt", "to": "Subtitles"}),
+        Rule({"type": "video", "match": "friends", "to": "Series", "priority": 60},
+             config=config),
+    ])
+
+
+def test_extension_index():
+    ruleset = get_ruleset()
+    rules = ruleset.rules
+    assert ruleset.get_rules("avi") == (rules[0], rules[1], rules[3]), \
+        "The rules should keep their order"
+    assert ruleset.get_rules("nfo") == (rules[0],)
+    assert ruleset.get_rules("") == (rules[0],)
+
+
+def test_classify():
+    ruleset = get_ruleset()
+    rules = ruleset.rules
+    assert ruleset.classify(Candidate("Friends.S01E01.avi")).rule is rules[3]
+    assert ruleset.classify(Candidate("movie.MKV")).rule is rules[1]
+    assert ruleset.classify(Candidate("movie.srt")).rule is rules[2]
+    assert ruleset.classify(Candidate("readme.nfo")).rule is None
+
+
+def test_priority_pruning(monkeypatch):
+    ruleset = get_ruleset()
+    catch_all = Rule({"action": "delete", "priority": 0})
+    tie = Rule({"match": "friends", "to": "Friends", "priority": 60})
+    ruleset = RuleSet(ruleset.rules + [catch_all, tie])
+    evaluated = []
+    original_match = Rule.match
+
+    def counting_match(rule, candidate, hits=None):
+        evaluated.append(rule)
+        return original_match(rule, candidate, hits=hits)
+
+    monkeypatch.setattr(Rule, "match", counting_match)
+    decision = ruleset.classify(Candidate("Friends.S01E01.avi"))
+    assert decision.unsure, "The rules with the same confidence are still a tie"
+    assert decision.top == [ruleset.rules[3], tie], "The tie keeps the rules order"
+    assert catch_all not in evaluated, "A lower priority rule can't win"
+
+    del evaluated[:]
+    assert ruleset.classify(Candidate("readme.nfo")).rule is catch_all
+    assert catch_all in evaluated
+
+
+def test_decision_cache(tmpdir, monkeypatch):
+    from afterdown.core.decisioncache import DecisionCache
+    source = tmpdir.mkdir("source")
+    source.join("Friends.S01E01.avi").write("episode")
+    source.join("readme.nfo").write("?")
+    cache_file = str(tmpdir.join(".afterdecisions"))
+    candidates = lambda: [Candidate(filepath=name, fullpath=str(source.join(name)))
+                          for name in ("Friends.S01E01.avi", "readme.nfo")]
+
+    ruleset = get_ruleset()
+    ruleset.cache = DecisionCache(cache_file, fingerprint="rules")
+    decisions = [ruleset.classify(candidate) for candidate in candidates()]
+    ruleset.cache.save()
+
+    ruleset = get_ruleset()
+    ruleset.cache = DecisionCache(cache_file, fingerprint="rules")
+    monkeypatch.setattr(Rule, "match", lambda rule, candidate, hits=None: 1 / 0)
+    cached = [ruleset.classify(candidate) for candidate in candidates()]
+    assert ruleset.cache.hits == 2
+    assert cached[0].rule is ruleset.rules[3]
+    assert [(confidence, rule.to) for confidence, rule in cached[0].matches] == \
+           [(confidence, rule.to) for confidence, rule in decisions[0].matches]
+    assert cached[1].rule is None and not cached[1].unsure
+
+    ruleset.cache = DecisionCache(cache_file, fingerprint="other rules")
+    with pytest.raises(ZeroDivisionError):
+        ruleset.classify(candidates()[1])
+
+
+def test_rules_profile(tmpdir):
+    from afterdown.core.profile import rules_profile, format_profile, export_profile
+    ruleset = get_ruleset()
+    for filepath in ("Friends.S01E01.avi", "movie.avi", "readme.nfo"):
+        ruleset.classify(Candidate(filepath))
+    profile = rules_profile(ruleset)
+    by_position = {stats['position']: stats for stats in profile}
+    assert by_position[1]['wins'] == 1
+    assert by_position[3]['wins'] == 1
+    assert by_position[3]['matched'] == 1
+    assert by_position[2]['evaluations'] == 0, "The srt rule shouldn't be evaluated"
+    assert set(by_position[3]['predicates']) == {"extension", "matches"}
+    report = format_profile(profile)
+    assert "rules never applied: #0" in report
+    export_profile(profile, str(tmpdir.join("profile.json")))
+    assert tmpdir.join("profile.json").check()
+
+
+def test_classify_batch():
+    filepaths = ["Friends.S01E01.avi", "movie.MKV", "movie.srt", "readme.nfo", "sample.avi",
+                 "Friends.sample.mkv"]
+    ruleset = get_ruleset()
+    expected = [ruleset.classify(Candidate(filepath)) for filepath in filepaths]
+    batch_ruleset = get_ruleset()
+    decisions = batch_ruleset.classify_batch([Candidate(filepath) for filepath in filepaths])
+    assert [decision.candidate.filepath for decision in decisions] == filepaths
+    for decision, single in zip(decisions, expected):
+        assert [batch_ruleset.rules.index(rule) for rule in decision.top] == \
+               [ruleset.rules.index(rule) for rule in single.top]
+        assert [confidence for confidence, rule in decision.matches] == \
+               [confidence for confidence, rule in single.matches]
+    assert batch_ruleset.wins == ruleset.wins
+    assert batch_ruleset.rules[1].match_many(
+        [Candidate("a.avi"), Candidate("a.txt")]) == [50, False]
+
+
+def test_shared_predicates(monkeypatch):
+    from afterdown.core import rules
+    parsed = []
+    monkeypatch.setattr(rules, "video_type",
+                        lambda filename: parsed.append(filename) or "serie")
+    config = {'types': {"video": Rule({"extensions": ["avi", "mkv"], "size": ">1"})}}
+    ruleset = RuleSet([
+        Rule({"type": "video", "foundType": "movie", "to": "Movies"}, config=config),
+        Rule({"type": "video", "foundType": "serie", "to": "Series"}, config=config),
+        Rule({"type": "video", "foundType": "serie", "match": "friends", "to": "Friends",
+              "priority": 40}, config=config),
+    ])
+    assert len(ruleset.shared_predicates[("extension", frozenset(["avi", "mkv"]))]) == 3
+    candidate = Candidate("Friends.S01E01.avi", stat=os.stat(__file__))
+    assert ruleset.classify(candidate).rule is ruleset.rules[1]
+    assert parsed == ["Friends.S01E01.avi"], "The guessit parse should be shared"
+    size_predicates = [predicate for rule in ruleset.rules for predicate in rule.plan
+                       if predicate.name == "size"]
+    assert sum(predicate.reused for predicate in size_predicates) == 1, \
+        "The size check of the type is done once (the last rule is pruned)"
+
+
+def test_columnar_batch(tmpdir, monkeypatch):
+    pytest.importorskip("numpy")
+    from afterdown.core import columnar
+    monkeypatch.setattr(columnar, "COLUMNAR_MIN_BATCH", 2)
+    config = {'types': {"video": Rule({"extensions": ["avi", "mkv"]})}}
+    source = tmpdir.mkdir("source")
+    candidates = []
+    for index in range(10):
+        filepath = "movie%d.%s" % (index, "avi" if index % 2 else "mkv")
+        source.join(filepath).write("x" * index * 100)
+        candidates.append(Candidate(filepath, fullpath=str(source.join(filepath))))
+    rules = lambda: [
+        Rule({"type": "video", "size": ">500", "to": "Big"}, config=config),
+        Rule({"type": "video", "size": "<=500", "match": "movie1", "to": "Small"}, config=config),
+        Rule({"type": "video", "priority": 10, "to": "Others"}, config=config),
+    ]
+    expected = RuleSet(rules())
+    expected = [expected.rules.index(decision.rule)
+                for decision in [expected.classify(candidate) for candidate in candidates]]
+    ruleset = RuleSet(rules())
+    decisions = ruleset.classify_batch(candidates)
+    assert [ruleset.rules.index(decision.rule) for decision in decisions] == expected
+    assert expected == [2, 1, 2, 2, 2, 2, 0, 0, 0, 0]
+
+
+def test_columnar_size_only_when_needed(tmpdir, monkeypatch):
+    """ The files rejected by the cheaper predicates are not stat for the size """
+    pytest.importorskip("numpy")
+    from afterdown.core import columnar
+    monkeypatch.setattr(columnar, "COLUMNAR_MIN_BATCH", 2)
+    source = tmpdir.mkdir("source")
+    source.join("wanted.avi").write("wanted")
+    # the other files don't exist: a stat would fail
+    candidates = [Candidate("other%d.avi" % index, fullpath=str(source.join("other%d.avi" % index)))
+                  for index in range(5)]
+    candidates.append(Candidate("wanted.avi", fullpath=str(source.join("wanted.avi"))))
+    ruleset = RuleSet([Rule({"match": "wanted", "size": ">1", "to": "Wanted"})])
+    decisions = ruleset.classify_batch(candidates)
+    assert [decision.rule is not None for decision in decisions] == [False] * 5 + [True]
+
+
+def test_batch_size(get_sorter, tmpdir):
+    sorter = get_sorter(batchSize=10)
+    sorter.run()
+    assert sorter.counters['_unknown_new'] == 1
+    assert sorter.counters['SKIP'] == 1
+    assert sorter.counters['MOVE'] == 1
+    assert tmpdir.join("target", "Movies", "movie.avi").check()
@@ -0,0 +1,71 @@
+import json
+import os
+
+import pytest
+
+from afterdown.core.rules import Rule
+
+
+@pytest.fixture
+def indexed_sorter(get_sorter, tmpdir):
+    """ As get_sorter, keeping the scan index """
+    return lambda **config: get_sorter(scanindex=str(tmpdir.join(".afterscan")), **config)
+
+
+def test_scan_index_replay(indexed_sorter, monkeypatch):
+    sorter = indexed_sorter()
+    sorter.run()
+    assert sorter.counters['_unknown_new'] == 1
+    assert sorter.counters['SKIP'] == 1
+    assert sorter.counters['MOVE'] == 1
+
+    matched = []
+    original_match = Rule.match
+
+    def counting_match(rule, candidate):
+        matched.append(candidate.filepath)
+        return original_match(rule, candidate)
+
+    monkeypatch.setattr(Rule, "match", counting_match)
+    resorter = indexed_sorter()
+    resorter.run()
+    assert matched == [], "Unchanged files should not be classified again"
+    assert resorter.counters['_tot'] == 2
+    assert resorter.counters['_unknown_old'] == 1
+    assert resorter.counters['SKIP'] == 1
+
+
+def test_scan_index_changed_file(indexed_sorter, tmpdir):
+    indexed_sorter().run()
+    unknown = tmpdir.join("source", "folder", "unknown.txt")
+    unknown.write("a bigger content")
+    os.utime(str(unknown), (0, 0))  # a changed mtime and size
+
+    sorter = indexed_sorter()
+    classified = []
+    original_process = sorter.replay_outcome
+    sorter.replay_outcome = lambda candidate: classified.append(candidate.filepath) \
+        or original_process(candidate)
+    sorter.run()
+    assert classified == ["keep.me"], "Only the unchanged file should be replayed"
+    assert sorter.counters['_unknown_old'] == 1
+
+
+def test_scan_index_rules_changed(indexed_sorter, tmpdir):
+    indexed_sorter().run()
+    sorter = indexed_sorter(rules=[
+        dict(match="keep", action="skip"),
+        dict(extension="avi", to="Movies"),
+        dict(extension="txt", action="delete"),
+    ])
+    sorter.run()
+    assert sorter.counters['DELETE'] == 1
+    assert not tmpdir.join("source", "folder", "unknown.txt").check()
+
+
+def test_scan_index_parallel_walk(indexed_sorter):
+    indexed_sorter(walkWorkers=3).run()
+    resorter = indexed_sorter(walkWorkers=3)
+    resorter.run()
+    assert resorter.counters['_tot'] == 2
+    assert resorter.counters['_unknown_old'] == 1
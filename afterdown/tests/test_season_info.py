@@ -23,5 +23,47 @@ def test_x_format():
     assert get_episode_infos('La que se avicina 1x02 bla bla bla') == ('01', '02')
 
 
+def test_quick_video_type():
+    from afterdown.core.season_info import quick_video_type
+    assert quick_video_type("Friends.S01E02.720p.mkv") == "serie"
+    assert quick_video_type("Serie/Treme.1x03.Right.Place.avi") == "serie"
+    assert quick_video_type("GameofThrones S6 Ep2 720p x265.mp4") == "serie"
+    assert quick_video_type("unlearning.mp4") is None
+    for name in ("The.Matrix.1999.1080p.BluRay.x264.mkv",
+                 "The.Daily.Show.2019.05.21.mkv",
+                 "Sherlock.2010.E02.mkv",
+                 "The.Expanse.2015.101.mkv",
+                 "True.Detective.2014.01of08.mkv",
+                 "Chernobyl.2019.1of5.mkv",
+                 "Mini.Series.2018.Part.II.mkv",
+                 "Twin.Peaks.1990.Pilot.mkv",
+                 "Mr.Robot.2015.eps1.0_hellofriend.mov"):
+        assert quick_video_type(name) is None, "A year alone doesn't tell %s is a movie" % name
+
+
+def test_quick_video_type_agrees_with_guessit():
+    from afterdown.core.season_info import quick_video_type
+    from afterdown.core.utils import guessit_video_type
+    for name in ("Friends.S01E02.720p.mkv",
+                 "Serie/Treme.1x03.Right.Place.avi",
+                 "Card.S03e01.ITA.ENG.XviD.Subs.DLMux-BlackBIT.avi",
+                 "2.Broke.Girls.4x22.E.ux.x264-GiuseppeTnT.mkv"):
+        assert quick_video_type(name) == guessit_video_type(name), name
+
+
+def test_video_type_check(monkeypatch):
+    from afterdown.core import utils
+    monkeypatch.setattr(utils, "video_type_stats", utils.VideoTypeStats(check=True))
+    monkeypatch.setattr(utils, "guessit_video_type",
+                        lambda filename: "serie" if "Treme" in filename else "movie")
+    assert utils.video_type("Friends.S01E02.mkv") == "serie"
+    assert utils.video_type("Treme.1x03.mkv") == "serie"
+    assert utils.video_type("The.Matrix.1999.mkv") == "movie"
+    stats = utils.video_type_stats
+    assert (stats.quick, stats.guessit, stats.agreed) == (2, 1, 1)
+    assert stats.disagreed == [("Friends.S01E02.mkv", "serie", "movie")]
+    assert "agreed with guessit on 1 of 2" in "%s" % stats
+
+
 if __name__ == '__main__':
     pytest.main()
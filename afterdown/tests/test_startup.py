@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# these are loaded only when a rule or the configuration needs them
+HEAVY_MODULES = ("guessit", "subliminal", "dropbox", "requests", "six", "numpy", "smtplib",
+                 "multiprocessing")
+
+
+def import_times(module):
+    """ Import the module in a new interpreter with -X importtime,
+        return its output and the {module: cumulative microseconds} of the imports
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import %s" % module],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=True, cwd=PROJECT_ROOT)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return process.stdout, times
+
+
+def test_fast_startup():
+    output, times = import_times("afterdown.__main__")
+    assert output == "", "Importing shouldn't print the banner"
+    loaded = {name.split(".")[0] for name in times}
+    for heavy_module in HEAVY_MODULES:
+        assert heavy_module not in loaded, "%s shouldn't be imported at startup" % heavy_module
+    assert times["afterdown.__main__"] < 2 * 1000 * 1000, "Afterdown should start in a moment"
+
+
+def test_noop_run_with_guessit_cache(tmpdir):
+    """ A run with nothing to sort doesn't import guessit, even keeping its cache """
+    config_file = tmpdir.join("rules.json")
+    config_file.write(json.dumps(dict(
+        source=str(tmpdir.mkdir("source")),
+        target=str(tmpdir.join("target")),
+        knownfiles=str(tmpdir.join(".afterknown")),
+        guessitcache=str(tmpdir.join(".afterguessit")),
+        rules=[dict(extension="avi", foundType="movie", to="Movies")],
+    )))
+    code = "; ".join([
+        "import sys",
+        "from afterdown.__main__ import AfterDown",
+        "AfterDown(config_file=%r).run()" % str(config_file),
+        "print('guessit' in sys.modules)",
+    ])
+    process = subprocess.run([sys.executable, "-c", code],
+                             stdout=subprocess.PIPE, universal_newlines=True, check=True,
+                             cwd=PROJECT_ROOT)
+    assert process.stdout.splitlines()[-1] == "False"
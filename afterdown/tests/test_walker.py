@@ -0,0 +1,82 @@
+import os
+
+from afterdown.core.candidate import Candidate
+from afterdown.core.rules import Rule
+from afterdown.core import walker
+from afterdown.core.walker import walk_folders, walk_source
+
+
+def test_walk_source(tmpdir):
+    tmpdir.mkdir("b").join("inner.avi").write("")
+    tmpdir.join("a.txt").write("")
+    tmpdir.mkdir("c").mkdir("deep").join("z.srt").write("")
+    tmpdir.join("b", "a_first.avi").write("")
+    filepaths = [candidate.filepath for candidate in walk_source(str(tmpdir))]
+    assert filepaths == [
+        "a.txt",
+        os.path.join("b", "a_first.avi"),
+        os.path.join("b", "inner.avi"),
+        os.path.join("c", "deep", "z.srt"),
+    ], "The walk should be top-down and sorted"
+
+
+def test_size_from_entry(tmpdir, monkeypatch):
+    tmpdir.join("big.avi").write("x" * 2048)
+    candidate, = walk_source(str(tmpdir))
+
+    def no_stat(*args, **kwargs):
+        raise AssertionError("The size should come from the DirEntry")
+
+    monkeypatch.setattr(os, "stat", no_stat)
+    monkeypatch.setattr(os.path, "getsize", no_stat)
+    assert Rule({"size": ">1K"}).match(candidate) == 50
+    assert Rule({"size": "<1K"}).match(candidate) is False
+    assert candidate.size == 2048
+
+
+def test_parallel_walk_order(tmpdir):
+    for folder in range(5):
+        for subfolder in range(4):
+            subdir = tmpdir.ensure("f%d" % folder, "s%d" % subfolder, dir=True)
+            for filename in ("b.avi", "a.srt"):
+                subdir.join(filename).write("")
+    tmpdir.join("root.nfo").write("")
+    sequential = [candidate.filepath for candidate in walk_source(str(tmpdir))]
+    parallel = [candidate.filepath for candidate in walk_source(str(tmpdir), workers=4)]
+    assert len(sequential) == 41
+    assert parallel == sequential, "The parallel walk should keep the same order"
+
+
+def test_parallel_walk_stopped(tmpdir):
+    for folder in range(10):
+        tmpdir.ensure("f%d" % folder, "file.avi")
+    walk = walk_source(str(tmpdir), workers=3)
+    assert next(walk).filepath == os.path.join("f0", "file.avi")
+    walk.close()  # stopping the walk leaves no pending work
+
+
+
+def test_parallel_walk_bounded():
+    """ The pool doesn't list the whole tree ahead of a slow consumer """
+    listed = []
+
+    def list_folder(folder):
+        listed.append(folder)
+        return ["s%d" % index for index in range(50)] if folder == "" else [], []
+
+    walk = walk_folders(list_folder, workers=2)
+    assert next(walk) == ("", [])
+    next(walk)
+    walk.close()
+    assert len(listed) <= 2 * walker.LIST_AHEAD + 2
+
+
+def test_candidate_features():
+    candidate = Candidate("Serie/The.Big.Bang.Theory.S10E22.HDTV.AVI")
+    assert candidate.extension == "avi"
+    assert candidate.basename == "The.Big.Bang.Theory.S10E22.HDTV.AVI"
+    assert candidate.lower_path == "serie/the.big.bang.theory.s10e22.hdtv.avi"
+    assert candidate.words_path == "seriethebigbangtheorys10e22hdtvavi"
+    assert candidate.episode_infos == ("10", "22")
+    assert candidate['filepath'] == candidate.filepath, "Candidates are readable as dicts"
+    assert Candidate("README").extension == ""
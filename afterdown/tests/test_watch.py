@@ -0,0 +1,53 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from afterdown.core.watch import SourceWatcher
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"),
+                                reason="inotify is Linux only")
+
+
+def test_debounced_file(tmpdir):
+    watcher = SourceWatcher(str(tmpdir), debounce=0.3)
+    try:
+        partial = tmpdir.join("download.avi")
+
+        def write_slowly():
+            for i in range(5):
+                with open(str(partial), "a") as f:
+                    f.write("chunk")
+                time.sleep(0.1)
+
+        writer = threading.Thread(target=write_slowly)
+        start = time.time()
+        writer.start()
+        assert watcher.wait() == ["download.avi"]
+        assert time.time() - start >= 0.7, "The file was returned while being written"
+        writer.join()
+        assert not watcher.pending
+    finally:
+        watcher.close()
+
+
+def test_new_folders_are_watched(tmpdir):
+    source = tmpdir.mkdir("source")
+    watcher = SourceWatcher(str(source), debounce=0.1)
+    try:
+        # a folder moved in with its files
+        tmpdir.mkdir("season").join("episode.mkv").write("")
+        os.rename(str(tmpdir.join("season")), str(source.join("season")))
+        assert watcher.wait() == [os.path.join("season", "episode.mkv")]
+        # a file created in the new folder
+        source.join("season", "episode2.mkv").write("")
+        assert watcher.wait() == [os.path.join("season", "episode2.mkv")]
+        # removed files are not returned
+        source.join("gone.txt").write("")
+        source.join("gone.txt").remove()
+        source.join("last.txt").write("")
+        assert watcher.wait() == ["last.txt"]
+    finally:
+        watcher.close()
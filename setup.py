@@ -30,12 +30,11 @@ setup(
 
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.6',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
     ],
+    python_requires='>=3.7',  # os.scandir, contextlib.nullcontext, the pool initializers
 
     keywords='deployment webfaction cli letsencrypt certificate',
     install_requires=['dropbox', 'requests', 'pytest',